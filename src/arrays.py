@@ -0,0 +1,184 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+NumPy versions of the start state passes.  The field is loaded into a boolean
+array once; runs are found by differencing each line, lone berries by
+comparing the array with its shifted neighbours, and the final grouping of
+berries by their horizontal and vertical greenhouse is a sort and a reduce.
+The runs and open berries come out exactly as the pure python passes in
+solve_problems build them, in the same order, so the random combining pass
+between them sees the same input either way.
+
+Merges are evaluated in bulk too.  A MergeTable holds a partition as arrays
+of corners and a summed-area table of the cells its greenhouses cover, and
+finds the merged box, cost change and validity of a block of pairs at once.
+
+NumPy is optional.  available() is false without it, and the solver keeps to
+the pure python passes.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from rectangle import GREENHOUSE_COST, make_rectangle
+
+T, L, B, R, COST = 0, 1, 2, 3, 4
+PAIR_BLOCK = 1 << 16  # pairs evaluated at once by a MergeTable
+
+
+def available():
+    """ return true if numpy can be imported """
+    return numpy is not None
+
+
+def field_array(field):
+    """ return the field as a boolean array, true where a berry grows """
+    grid = numpy.zeros((field.num_rows, field.num_cols), dtype=bool)
+    for row, cols in enumerate(field.row_cols):
+        grid[row, cols] = True
+    return grid
+
+
+def run_rectangles(grid):
+    """ return a rectangle for each horizontal run of two or more berries,
+    row by row and left to right.  pass the transpose for vertical runs """
+    padded = numpy.zeros((grid.shape[0], grid.shape[1] + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = grid
+    steps = numpy.diff(padded, axis=1)
+    rows, starts = numpy.nonzero(steps == 1)
+    _, ends = numpy.nonzero(steps == -1)
+    keep = ends - starts > 1
+    return zip(rows[keep].tolist(), starts[keep].tolist(),
+               (ends[keep] - 1).tolist())
+
+
+def lone_berries(grid):
+    """ return a mask of the berries with no berry beside them in a row """
+    paired = numpy.zeros_like(grid)
+    paired[:, 1:] |= grid[:, :-1]
+    paired[:, :-1] |= grid[:, 1:]
+    return grid & ~paired
+
+
+def horizontal_start(grid):
+    """ the horizontal runs and then the berries they leave open, as
+    get_horizontal_runs and assign_open_greenhouses build them """
+    partition = [make_rectangle(row, start, row, end)
+                 for row, start, end in run_rectangles(grid)]
+    rows, cols = numpy.nonzero(lone_berries(grid))
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        partition.append(make_rectangle(row, col, row, col))
+    return partition
+
+
+def vertical_start(grid):
+    """ the vertical runs and then the berries they leave open, as
+    get_vertical_runs and assign_open_greenhouses build them """
+    partition = [make_rectangle(row_start, col, row_end, col)
+                 for col, row_start, row_end in run_rectangles(grid.T)]
+    rows, cols = numpy.nonzero(lone_berries(grid.T).T)
+    for row, col in zip(rows.tolist(), cols.tolist()):
+        partition.append(make_rectangle(row, col, row, col))
+    return partition
+
+
+def owners(grid, partition):
+    """ return an array holding, for each cell, the index of the first
+    rectangle of the partition covering it, or -1 """
+    labels = numpy.empty(grid.shape, dtype=numpy.intp)
+    labels.fill(-1)
+    for idx in xrange(len(partition) - 1, -1, -1):
+        rect = partition[idx]
+        labels[rect[T]:rect[B] + 1, rect[L]:rect[R] + 1] = idx
+    return labels
+
+
+def group_berries(grid, horizontal, vertical):
+    """ return the bounding rectangle of each group of berries sharing both
+    a horizontal and a vertical greenhouse """
+    rows, cols = numpy.nonzero(grid)
+    if not len(rows):
+        return []
+    across = owners(grid, horizontal)[rows, cols]
+    down = owners(grid, vertical)[rows, cols]
+    keys = (across + 1) * (len(vertical) + 1) + down + 1
+    order = numpy.argsort(keys, kind="mergesort")
+    keys, rows, cols = keys[order], rows[order], cols[order]
+    starts = numpy.concatenate(
+        ([0], numpy.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    bounds = zip(numpy.minimum.reduceat(rows, starts).tolist(),
+                 numpy.minimum.reduceat(cols, starts).tolist(),
+                 numpy.maximum.reduceat(rows, starts).tolist(),
+                 numpy.maximum.reduceat(cols, starts).tolist())
+    return [make_rectangle(*bound) for bound in bounds]
+
+
+class MergeTable(object):
+    """ the merges of every pair of a partition's greenhouses.  the
+    greenhouses of a partition are disjoint, so the box around two of them
+    overlaps no third exactly when the covered cells inside it are the two
+    greenhouses' own, which the summed-area table counts in constant time.
+    pairs (i, j), i < j, come in the order itertools.combinations gives """
+
+    def __init__(self, houses):
+        """ load the greenhouses, in the order their pairs are wanted """
+        corners = numpy.array([house[:COST + 1] for house in houses],
+                              dtype=numpy.int64).reshape(-1, COST + 1)
+        self.size = len(corners)
+        self.top = corners[:, T].min() if self.size else 0
+        self.left = corners[:, L].min() if self.size else 0
+        self.tops = corners[:, T] - self.top
+        self.lefts = corners[:, L] - self.left
+        self.bottoms = corners[:, B] - self.top
+        self.rights = corners[:, R] - self.left
+        self.costs = corners[:, COST]
+        height = self.bottoms.max() + 1 if self.size else 0
+        width = self.rights.max() + 1 if self.size else 0
+        covered = numpy.zeros((height + 1, width + 1), dtype=numpy.int64)
+        for top, left, bottom, right in zip(self.tops.tolist(),
+                                            self.lefts.tolist(),
+                                            self.bottoms.tolist(),
+                                            self.rights.tolist()):
+            covered[top + 1:bottom + 2, left + 1:right + 2] = 1
+        self.sat = covered.cumsum(axis=0).cumsum(axis=1)
+
+    def blocks(self, size=PAIR_BLOCK):
+        """ generate (first, stop) ranges of first indices whose pairs
+        number about size, so a block's arrays stay small """
+        first = 0
+        while first < self.size - 1:
+            stop = first + 1
+            pairs = self.size - stop
+            while stop < self.size - 1 and pairs < size:
+                stop += 1
+                pairs += self.size - stop
+            yield first, stop
+            first = stop
+
+    def evaluate(self, first, stop, limit):
+        """ return the number of pairs whose first greenhouse is in
+        [first, stop), how many of them overlap a third greenhouse, and
+        the pairs (i, j) that do not and whose merge changes the cost by
+        at most limit, with those cost changes, as lists """
+        later = numpy.arange(self.size)
+        mask = later > numpy.arange(first, stop)[:, None]
+        rows, seconds = numpy.nonzero(mask)
+        firsts = rows + first
+        tops = numpy.minimum(self.tops[firsts], self.tops[seconds])
+        lefts = numpy.minimum(self.lefts[firsts], self.lefts[seconds])
+        bottoms = numpy.maximum(self.bottoms[firsts], self.bottoms[seconds])
+        rights = numpy.maximum(self.rights[firsts], self.rights[seconds])
+        sat = self.sat
+        covered = (sat[bottoms + 1, rights + 1] - sat[tops, rights + 1] -
+                   sat[bottoms + 1, lefts] + sat[tops, lefts])
+        own = self.costs[firsts] + self.costs[seconds] - 2 * GREENHOUSE_COST
+        area = (bottoms - tops + 1) * (rights - lefts + 1)
+        deltas = area - own - GREENHOUSE_COST
+        clear = covered == own
+        keep = clear & (deltas <= limit)
+        return (len(firsts), len(firsts) - int(clear.sum()),
+                firsts[keep].tolist(), seconds[keep].tolist(),
+                deltas[keep].tolist())
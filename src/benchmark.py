@@ -0,0 +1,333 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Benchmark harness for the heuristic solver.
+
+Fields are generated from a seed, so every run measures the same problems:
+
+    random       berries scattered uniformly
+    clustered    a few dense blobs on an empty field
+    sparse       a handful of lone berries
+    adversarial  diagonals and a lattice of lone berries, which give the
+                 start state many greenhouses and agglomeration little to
+                 merge cheaply
+
+Each case is solved in a fresh process so its peak memory is its own.  The
+phases are timed separately: the start state (excluding the density pass),
+combine_and_maintain_density, agglomerate and display.  Timings are the
+fastest of --repeat runs.  The report is JSON; given a baseline report the
+harness lists every case that got slower, costlier or larger beyond the
+tolerances and exits nonzero if there are any.
+
+    PATH_TO_PYTHON benchmark.py --output=baseline.json
+    PATH_TO_PYTHON benchmark.py --baseline=baseline.json
+"""
+
+import json
+import platform
+import random
+import resource
+import sys
+import time
+from multiprocessing import Pipe, Process
+from optparse import OptionParser
+
+import memoize
+import solve_problems
+from field import StrawberryField
+from solve_problems import BEAM_WIDTH, FRONTIERS, Settings, agglomerate, \
+    get_score, get_start_state
+
+KINDS = ("random", "clustered", "sparse", "adversarial")
+SIZES = (10, 25, 50, 100)
+PHASES = ("start_state", "combine", "agglomerate", "display")
+
+
+def random_field(size, rng):
+    """ berries scattered uniformly, about one cell in fifty """
+    return [[rng.random() < 0.02 for _ in xrange(size)]
+            for _ in xrange(size)]
+
+
+def clustered_field(size, rng):
+    """ a few dense blobs, more of them on larger fields """
+    cells = [[False] * size for _ in xrange(size)]
+    for _ in xrange(max(2, size // 15)):
+        row, col = rng.randrange(size), rng.randrange(size)
+        height = rng.randint(1, 1 + size // 8)
+        width = rng.randint(1, 1 + size // 8)
+        for r in xrange(max(0, row - height), min(size, row + height + 1)):
+            for c in xrange(max(0, col - width), min(size, col + width + 1)):
+                if rng.random() < 0.7:
+                    cells[r][c] = True
+    return cells
+
+
+def sparse_field(size, rng):
+    """ a handful of lone berries """
+    cells = [[False] * size for _ in xrange(size)]
+    for _ in xrange(max(2, size // 8)):
+        cells[rng.randrange(size)][rng.randrange(size)] = True
+    return cells
+
+
+def adversarial_field(size, rng):
+    """ the two diagonals plus a coarse lattice of lone berries.  no two
+    berries share a run, so every one starts in its own greenhouse """
+    cells = [[False] * size for _ in xrange(size)]
+    step = max(3, size // 6)
+    offset = rng.randrange(step)
+    for r in xrange(size):
+        cells[r][r] = True
+        cells[r][size - 1 - r] = True
+    for r in xrange(offset, size, step):
+        for c in xrange(offset, size, step):
+            cells[r][c] = True
+    return cells
+
+
+GENERATORS = {"random": random_field,
+              "clustered": clustered_field,
+              "sparse": sparse_field,
+              "adversarial": adversarial_field}
+
+
+def make_problem(kind, size, seed):
+    """ return the input lines of a generated problem.  the seed and the
+    case name fix the field, so a case is the same in every report """
+    rng = random.Random("%s-%s-%s" % (seed, kind, size))
+    cells = GENERATORS[kind](size, rng)
+    if not any(any(row) for row in cells):
+        cells[rng.randrange(size)][rng.randrange(size)] = True
+    rows = ["".join(cell and "@" or "." for cell in row) for row in cells]
+    return [str(min(10, max(2, size // 5)))] + rows
+
+
+class PhaseTimer(object):
+    """ time calls to module functions by swapping in a timed wrapper """
+
+    def __init__(self):
+        """ start with nothing timed """
+        self.seconds = {}
+        self.originals = []
+
+    def wrap(self, module, name, phase):
+        """ charge the time spent in module.name to phase """
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            started = time.time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(phase, time.time() - started)
+        setattr(module, name, timed)
+        self.originals.append((module, name, original))
+
+    def add(self, phase, seconds):
+        """ charge seconds to phase """
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def restore(self):
+        """ put the original functions back """
+        for module, name, original in reversed(self.originals):
+            setattr(module, name, original)
+        self.originals = []
+
+
+def run_once(data, settings):
+    """ solve a problem once; return its cost and the seconds per phase """
+    timer = PhaseTimer()
+    timer.wrap(solve_problems, "combine_and_maintain_density", "combine")
+    try:
+        field = StrawberryField(data)
+        with memoize.problem_scope():
+            rng = settings.rng(data)
+            started = time.time()
+            start_state = get_start_state(field, rng)
+            timer.add("start_state", time.time() - started -
+                      timer.seconds.get("combine", 0.0))
+            started = time.time()
+            solution = agglomerate(field, start_state, 2, None,
+                                   settings.beam_width, settings.tie_break,
+                                   rng, settings.frontier)[0]
+            timer.add("agglomerate", time.time() - started)
+            started = time.time()
+            field.display(solution)
+            timer.add("display", time.time() - started)
+    finally:
+        timer.restore()
+    return get_score(solution), len(start_state), timer.seconds
+
+
+def run_case(kind, size, options):
+    """ generate and solve one case; return its report entry """
+    if options.cache_size is not None:
+        memoize.set_maxsize(options.cache_size)
+    data = make_problem(kind, size, options.seed)
+    settings = Settings(beam_width=options.beam_width,
+                        frontier=options.frontier, seed=options.seed)
+    phases = None
+    for _ in xrange(options.repeat):
+        cost, starts, seconds = run_once(data, settings)
+        if phases is None:
+            phases = seconds
+        else:
+            for phase in PHASES:
+                phases[phase] = min(phases[phase], seconds[phase])
+    return {"name": "%s-%dx%d" % (kind, size, size),
+            "kind": kind,
+            "size": size,
+            "berries": sum(row.count("@") for row in data[1:]),
+            "max_greenhouses": int(data[0]),
+            "start_greenhouses": starts,
+            "cost": cost,
+            "phases": dict((phase, round(phases[phase], 6))
+                           for phase in PHASES),
+            "seconds": round(sum(phases.values()), 6),
+            "peak_memory_kb": resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss}
+
+
+def _child(conn, kind, size, options):
+    """ run a case in a child process and send back its entry """
+    try:
+        conn.send(run_case(kind, size, options))
+    except Exception, err:
+        conn.send({"name": "%s-%dx%d" % (kind, size, size),
+                   "error": "%s: %s" % (type(err).__name__, err)})
+    conn.close()
+
+
+def run_isolated(kind, size, options):
+    """ run a case in a fresh process, so the memory high water mark and
+    the caches are its alone """
+    parent, child = Pipe(False)
+    process = Process(target=_child, args=(child, kind, size, options))
+    process.start()
+    entry = parent.recv()
+    process.join()
+    return entry
+
+
+def compare(report, baseline, options):
+    """ return a line for each case that regressed against the baseline.
+    time and memory may grow by their tolerance; cost may not grow at all,
+    since the same seed solves the same fields the same way """
+    previous = dict((case["name"], case) for case in baseline["cases"])
+    regressions = []
+    for case in report["cases"]:
+        old = previous.get(case["name"])
+        if old is None or "error" in old:
+            continue
+        if "error" in case:
+            regressions.append("%s: %s" % (case["name"], case["error"]))
+            continue
+        if case["cost"] > old["cost"]:
+            regressions.append("%s: cost %d, was %d"
+                               % (case["name"], case["cost"], old["cost"]))
+        allowed = max(old["seconds"] * (1 + options.time_tolerance),
+                      old["seconds"] + options.min_seconds)
+        if case["seconds"] > allowed:
+            regressions.append("%s: %.3fs, was %.3fs"
+                               % (case["name"], case["seconds"],
+                                  old["seconds"]))
+        allowed = old["peak_memory_kb"] * (1 + options.memory_tolerance)
+        if case["peak_memory_kb"] > allowed:
+            regressions.append("%s: peak memory %dkB, was %dkB"
+                               % (case["name"], case["peak_memory_kb"],
+                                  old["peak_memory_kb"]))
+    return regressions
+
+
+def main():
+    """ entry point """
+    usage = "usage: %prog [options]"
+    parser = OptionParser(usage)
+    parser.add_option("-k", "--kinds", dest="kinds", default=",".join(KINDS),
+                      help="comma separated field kinds [default: %default]")
+    parser.add_option("-z", "--sizes", dest="sizes",
+                      default=",".join(map(str, SIZES)),
+                      help="comma separated field sizes [default: %default]")
+    parser.add_option("--seed", dest="seed", type="int", default=1,
+                      help="seed for the fields and the search "
+                      "[default: %default]")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=1,
+                      help="time each case N times and keep the fastest "
+                      "[default: %default]")
+    parser.add_option("-b", "--beam-width", dest="beam_width", type="int",
+                      default=BEAM_WIDTH,
+                      help="successors kept per generation [default: "
+                      "%default]")
+    parser.add_option("--frontier", dest="frontier", default="ties",
+                      type="choice", choices=FRONTIERS,
+                      help="beam frontier [default: %default]")
+    parser.add_option("--cache-size", dest="cache_size", type="int",
+                      default=None,
+                      help="entries kept by each memoized function")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="write the JSON report to FILENAME")
+    parser.add_option("--baseline", dest="baseline", default=None,
+                      help="fail if slower or costlier than this report")
+    parser.add_option("--time-tolerance", dest="time_tolerance",
+                      type="float", default=0.25,
+                      help="allowed fractional slowdown [default: %default]")
+    parser.add_option("--min-seconds", dest="min_seconds", type="float",
+                      default=0.05,
+                      help="slowdowns under this many seconds are noise "
+                      "[default: %default]")
+    parser.add_option("--memory-tolerance", dest="memory_tolerance",
+                      type="float", default=0.25,
+                      help="allowed fractional growth in peak memory "
+                      "[default: %default]")
+    (options, _) = parser.parse_args()
+    kinds = options.kinds.split(",")
+    for kind in kinds:
+        if kind not in GENERATORS:
+            parser.error("unknown kind %r" % kind)
+    try:
+        sizes = [int(size) for size in options.sizes.split(",")]
+    except ValueError:
+        parser.error("--sizes must be a list of integers")
+    if options.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    report = {"python": platform.python_version(),
+              "machine": platform.machine(),
+              "seed": options.seed,
+              "repeat": options.repeat,
+              "beam_width": options.beam_width,
+              "frontier": options.frontier,
+              "cache_size": options.cache_size,
+              "cases": []}
+    for size in sizes:
+        for kind in kinds:
+            case = run_isolated(kind, size, options)
+            report["cases"].append(case)
+            if "error" in case:
+                print >> sys.stderr, "%-22s %s" % (case["name"], case["error"])
+            else:
+                print >> sys.stderr, "%-22s cost %5d %9.3fs %8dkB" % (
+                    case["name"], case["cost"], case["seconds"],
+                    case["peak_memory_kb"])
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as out:
+            out.write(text + "\n")
+    else:
+        print text
+
+    if options.baseline:
+        with open(options.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(report, baseline, options)
+        for line in regressions:
+            print >> sys.stderr, "REGRESSION", line
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Checkpoints of long searches, so a search that is killed can carry on where
+it left off.
+
+A checkpoint is a small JSON file per problem, named by a digest of the
+problem and of the settings that decide its covering, so a checkpoint is
+only ever resumed by the search it came from.  The search saves one every
+so many seconds and whenever its budget stops it early; the file is
+replaced whole, by renaming, so a kill part way through a save leaves the
+previous checkpoint in place.  A search that completes removes its file.
+"""
+
+import json
+import os
+import tempfile
+import time
+from hashlib import sha1
+
+DEFAULT_SECONDS = 60.0
+
+
+def checkpoint_path(directory, text, fingerprint):
+    """ return the checkpoint file in directory of the problem with this
+    text, solved under settings with this fingerprint """
+    digest = sha1("%s\n%s" % (fingerprint, text)).hexdigest()
+    return os.path.join(directory, digest + ".json")
+
+
+class Checkpoint(object):
+    """ the checkpoint file of one search """
+
+    def __init__(self, path, seconds=DEFAULT_SECONDS, resume=False):
+        """ save to path at most every seconds.  with resume, the state
+        saved there before, if any, is loaded as state """
+        self.path = path
+        self.seconds = seconds
+        self.saved = time.time()
+        self.state = self.load() if resume else None
+
+    def due(self):
+        """ return true if the last save is seconds old """
+        return time.time() - self.saved >= self.seconds
+
+    def load(self):
+        """ return the saved state, or None if there is none or it cannot be
+        read """
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return None
+
+    def save(self, state):
+        """ replace the saved state """
+        directory = os.path.dirname(self.path) or "."
+        handle, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as out:
+                json.dump(state, out, separators=(",", ":"))
+            os.rename(temp, self.path)
+        except Exception:
+            os.remove(temp)
+            raise
+        self.saved = time.time()
+
+    def remove(self):
+        """ remove the saved state, if any """
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,199 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Splitting a field into parts that can be solved on their own.
+
+Strawberries closer than a gap, in rows and in columns both, belong to the
+same group.  Groups whose bounding boxes meet are joined, so every group's
+box holds its own strawberries and no others, and greenhouses found for one
+group cannot overlap those found for another.  A greenhouse spanning two
+groups would cover at least the gap between them, so a wide gap makes it
+poor value.
+
+Each group is solved alone, keeping the cheapest covering it found with each
+number of greenhouses.  The coverings are then chosen, one per group, by a
+knapsack over the number of greenhouses, so the total stays within the
+field's limit at the least total cost.
+
+A field with more groups than greenhouses allowed, or a search that cannot
+merge its way down to the limit without swallowing a third greenhouse, is
+collapsed instead: greenhouses are merged in pairs, the merged box growing to
+take in every greenhouse it meets, at the least added cost each time, until
+few enough are left.
+"""
+
+from rectangle import make_rectangle
+
+T, L, B, R, COST = 0, 1, 2, 3, 4
+SPLIT_GAP = 5  # strawberries this many cells apart or more may be split
+NEIGHBOURS = 8  # nearest greenhouses tried as partners of each in collapse
+
+
+def berry_groups(berries, gap=SPLIT_GAP):
+    """ return the strawberries split into groups, each a list of points.
+    strawberries less than gap rows and gap columns apart share a group,
+    and groups with overlapping bounding boxes are joined """
+    rows = {}
+    for row, col in berries:
+        rows.setdefault(row, []).append(col)
+
+    # runs of strawberries less than gap apart in a row, and their columns
+    segments = []
+    members = []
+    for row in sorted(rows):
+        cols = sorted(rows[row])
+        begin = 0
+        for idx in xrange(1, len(cols) + 1):
+            if idx == len(cols) or cols[idx] - cols[idx - 1] >= gap:
+                segments.append((row, cols[begin], cols[idx - 1]))
+                members.append(cols[begin:idx])
+                begin = idx
+
+    # join segments less than gap rows apart whose columns come within gap
+    parent = range(len(segments))
+
+    def find(idx):
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    active = []
+    for idx, (row, first, last) in enumerate(segments):
+        active = [other for other in active
+                  if row - segments[other][0] < gap]
+        for other in active:
+            _, other_first, other_last = segments[other]
+            if first - other_last < gap and other_first - last < gap:
+                parent[find(other)] = find(idx)
+        active.append(idx)
+
+    boxes = {}
+    for idx, (row, first, last) in enumerate(segments):
+        root = find(idx)
+        box = boxes.get(root)
+        if box is None:
+            boxes[root] = [row, first, row, last]
+        else:
+            box[T] = min(box[T], row)
+            box[L] = min(box[L], first)
+            box[B] = max(box[B], row)
+            box[R] = max(box[R], last)
+
+    # join groups until no two bounding boxes meet
+    groups = [(box, [root]) for root, box in sorted(boxes.items())]
+    joined = True
+    while joined:
+        joined = False
+        kept = []
+        for box, roots in groups:
+            for other in kept:
+                other_box = other[0]
+                if not (box[B] < other_box[T] or other_box[B] < box[T] or
+                        box[R] < other_box[L] or other_box[R] < box[L]):
+                    other_box[T] = min(other_box[T], box[T])
+                    other_box[L] = min(other_box[L], box[L])
+                    other_box[B] = max(other_box[B], box[B])
+                    other_box[R] = max(other_box[R], box[R])
+                    other[1].extend(roots)
+                    joined = True
+                    break
+            else:
+                kept.append((box, roots))
+        groups = kept
+
+    numbers = {}
+    for number, (_, roots) in enumerate(groups):
+        for root in roots:
+            numbers[root] = number
+    points = [[] for _ in groups]
+    for idx, segment in enumerate(segments):
+        points[numbers[find(idx)]].extend([(segment[0], col)
+                                           for col in members[idx]])
+    return points
+
+
+def cheapest_combination(curves, limit):
+    """ curves holds, for each group, a dict from a number of greenhouses
+    to the cost of the cheapest covering found with that many.  return the
+    number of greenhouses to take from each group for the least total cost
+    with at most limit greenhouses in all, or None if no choice fits """
+    # best[n] is the least cost of the groups so far using n greenhouses,
+    # with the choices that got it
+    best = {0: (0, [])}
+    for curve in curves:
+        step = {}
+        for used, (cost, choices) in best.items():
+            for count, extra in curve.items():
+                total = used + count
+                if total > limit:
+                    continue
+                known = step.get(total)
+                if known is None or cost + extra < known[0]:
+                    step[total] = (cost + extra, choices + [count])
+        best = step
+    if not best:
+        return None
+    return min(best.values())[1]
+
+
+def place(rects, top, left):
+    """ return rectangles found on a cropped field placed back on the field
+    at top, left """
+    return [make_rectangle(rect[T] + top, rect[L] + left,
+                           rect[B] + top, rect[R] + left) for rect in rects]
+
+
+def gap(rect, other):
+    """ return the rows plus columns between two rectangles """
+    return (max(0, other[T] - rect[B], rect[T] - other[B]) +
+            max(0, other[L] - rect[R], rect[L] - other[R]))
+
+
+def absorb(first, second, houses):
+    """ return the bounding box of two greenhouses, grown until it meets no
+    other greenhouse in houses, the greenhouses inside it and those left """
+    box = [min(first[T], second[T]), min(first[L], second[L]),
+           max(first[B], second[B]), max(first[R], second[R])]
+    held = [first, second]
+    kept = [rect for rect in houses
+            if rect is not first and rect is not second]
+    grown = True
+    while grown:
+        grown = False
+        rest = []
+        for rect in kept:
+            if (box[B] < rect[T] or rect[B] < box[T] or
+                    box[R] < rect[L] or rect[R] < box[L]):
+                rest.append(rect)
+                continue
+            box[T] = min(box[T], rect[T])
+            box[L] = min(box[L], rect[L])
+            box[B] = max(box[B], rect[B])
+            box[R] = max(box[R], rect[R])
+            held.append(rect)
+            grown = True
+        kept = rest
+    return make_rectangle(*box), held, kept
+
+
+def collapse(houses, limit, shrink):
+    """ return a covering of at most limit greenhouses made from houses, a
+    covering with more.  each step tries each greenhouse with its
+    NEIGHBOURS nearest, absorbs what their box meets, shrinks the box to
+    its strawberries with shrink, and keeps the merge adding least cost """
+    houses = list(houses)
+    while len(houses) > limit:
+        best = None
+        for idx, first in enumerate(houses):
+            others = houses[:idx] + houses[idx + 1:]
+            others.sort(key=lambda rect: (gap(first, rect), rect))
+            for second in others[:NEIGHBOURS]:
+                box, held, kept = absorb(first, second, houses)
+                merged = shrink(box)
+                added = merged[COST] - sum([rect[COST] for rect in held])
+                if best is None or (added, merged) < best[:2]:
+                    best = (added, merged, kept)
+        houses = best[2] + [best[1]]
+    return houses
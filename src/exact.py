@@ -0,0 +1,313 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Exact search for the cheapest covering, used to measure how far the
+agglomerative heuristic is from optimal.  There are two engines.
+
+guillotine_cover is a dynamic program over straight cuts. Each side of a
+cut is shrunk to its feasible region, so a subproblem is keyed by the
+berries it holds and memoized across every cut that produces it. The
+result is optimal among covers that can be cut apart by straight lines.
+
+branch_and_bound searches general covers. It always covers the first
+uncovered berry in row major order, trying every tight rectangle that fits
+beside the greenhouses already placed, and prunes with a lower bound built
+from each row and each column.  Subproblems are keyed by the blocked cells
+from the current row down, which is all the rest of the search depends on.
+
+solve_exact runs the two in turn: the guillotine optimum is the incumbent
+the search has to beat, or prove cannot be beaten.
+"""
+
+import sys
+import time
+
+from field import bits
+from rectangle import make_rectangle
+
+T, L, B, R, COST, AREA = 0, 1, 2, 3, 4, 5
+TABLE_SIZE = 1 << 20  # subproblems kept by branch_and_bound
+INFEASIBLE = 1 << 20  # cost of covering a line with too few intervals
+
+
+class SearchTimeout(Exception):
+    """ raised inside guillotine_cover or branch_and_bound when the
+    deadline passes or the search is cancelled """
+
+
+def solve_exact(field, seconds=None, cancel=None, deadline=None):
+    """ return the cheapest covering found and whether it is proven
+    optimal.  with seconds set the general search stops at the deadline,
+    leaving the best covering found so far unproven; it stops the same way
+    once cancel, if given, is set.  deadline, in seconds, bounds both
+    engines; if it passes or cancel is set during the guillotine program,
+    the one greenhouse over every berry is returned, unproven """
+    stop = None
+    if deadline is not None:
+        stop = time.time() + deadline
+    try:
+        cost, solution = guillotine_cover(field, stop, cancel)
+    except SearchTimeout:
+        root = field.root_region
+        return ([root] if root[T] <= root[B] else []), False
+    if seconds is not None:
+        search_stop = time.time() + seconds
+        stop = search_stop if stop is None else min(stop, search_stop)
+    return branch_and_bound(field, cost, list(solution), stop, cancel)
+
+
+def guillotine_cover(field, deadline=None, cancel=None):
+    """ return the cost and greenhouses of the cheapest guillotine cover
+    using at most field.maximum_greenhouses greenhouses.  raise
+    SearchTimeout once the deadline passes or cancel is set """
+    return GuillotineCover(field, deadline, cancel).curve(
+        field.root_region)[-1]
+
+
+class GuillotineCover(object):
+    """ the guillotine dynamic program for one field.  curves are memoized
+    by feasible region, that is by the set of berries they cover """
+
+    def __init__(self, field, deadline=None, cancel=None):
+        """ set up an empty memo for the field """
+        self.field = field
+        self.deadline = deadline
+        self.cancel = cancel
+        self.limit = max(field.maximum_greenhouses, 1)
+        self.feasible_region = field.feasible_region
+        self.curves = {}
+
+    def curve(self, region):
+        """ return the cheapest guillotine covers of a feasible region.
+        curve[k] is the (cost, greenhouses) pair using at most k
+        greenhouses, for k = 1 .. field.maximum_greenhouses """
+        try:
+            return self.curves[region]
+        except KeyError:
+            pass
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        if self.cancel is not None and self.cancel.is_set():
+            raise SearchTimeout()
+        limit = self.limit
+        curve = [None] + [(region[COST], (region,))] * limit
+        count = self.field.count
+        top, left, bottom, right = region[T], region[L], region[B], region[R]
+        for cut in xrange(top, bottom):
+            # cutting below an empty row repeats the cut above it
+            if count(cut, left, cut, right):
+                self.join(curve,
+                          make_rectangle(top, left, cut, right),
+                          make_rectangle(cut + 1, left, bottom, right))
+        for cut in xrange(left, right):
+            if count(top, cut, bottom, cut):
+                self.join(curve,
+                          make_rectangle(top, left, bottom, cut),
+                          make_rectangle(top, cut + 1, bottom, right))
+        # at most k greenhouses includes the covers using fewer
+        for k in xrange(2, limit + 1):
+            if curve[k - 1][0] < curve[k][0]:
+                curve[k] = curve[k - 1]
+        self.curves[region] = curve
+        return curve
+
+    def join(self, curve, first, second):
+        """ fold the covers of the two sides of a cut into the curve """
+        first = self.feasible_region(first)
+        second = self.feasible_region(second)
+        # each side needs a greenhouse at least as large as its berry count
+        count = self.field.num_strawberries
+        floor = (first[COST] - first[AREA] + count(first) +
+                 second[COST] - second[AREA] + count(second))
+        if floor >= max([cost for cost, _ in curve[2:]] or [0]):
+            return
+        first_curve = self.curve(first)
+        second_curve = self.curve(second)
+        limit = self.limit
+        for k1 in xrange(1, limit):
+            cost1, houses1 = first_curve[k1]
+            for k2 in xrange(1, limit - k1 + 1):
+                cost2, houses2 = second_curve[k2]
+                if cost1 + cost2 < curve[k1 + k2][0]:
+                    curve[k1 + k2] = (cost1 + cost2, houses1 + houses2)
+
+
+def branch_and_bound(field, incumbent_cost, incumbent, deadline=None,
+                     cancel=None):
+    """ search general covers for one cheaper than the incumbent.  return
+    the cheapest covering and whether the search finished, proving it
+    optimal.  cancel is anything with an is_set method """
+    search = CoverSearch(field, incumbent_cost, incumbent, deadline, cancel)
+    try:
+        search.search([0] * field.num_rows, 0, field.maximum_greenhouses,
+                      incumbent_cost, 0, [])
+    except SearchTimeout:
+        return search.best, False
+    return search.best, True
+
+
+class CoverSearch(object):
+    """ state of one branch_and_bound run.  blocked holds one bitmask per
+    row of the cells taken by greenhouses placed so far """
+
+    def __init__(self, field, incumbent_cost, incumbent, deadline,
+                 cancel=None):
+        """ set up a search that must beat the incumbent """
+        self.field = field
+        self.best_cost = incumbent_cost
+        self.best = incumbent
+        self.deadline = deadline
+        self.cancel = cancel
+        self.table = {}
+        self.lines = {}
+
+    def search(self, blocked, row, houses, budget, cost, placed):
+        """ cover the berries left uncovered by blocked with at most houses
+        greenhouses.  return (future cost, greenhouses) if a covering cheaper
+        than budget exists, or (lower bound, None) if not """
+        field = self.field
+        masks = field.row_masks
+        while row < field.num_rows and not masks[row] & ~blocked[row]:
+            row += 1
+        if row == field.num_rows:
+            self.store(cost, placed)
+            return 0, []
+        if houses == 0:
+            return INFEASIBLE, None
+        key = (row, houses, tuple(blocked[row:]))
+        known = self.table.get(key)
+        if known is not None:
+            value, rects = known
+            if value >= budget:
+                return value, None
+            if rects is not None:
+                self.store(cost + value, placed + rects)
+                return known
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        if self.cancel is not None and self.cancel.is_set():
+            raise SearchTimeout()
+        bound = self.lower_bound(blocked, row, houses)
+        if bound >= budget:
+            return self.remember(key, bound, None)
+
+        best, best_rects, floor = budget, None, sys.maxsize
+        for rect in self.candidates(blocked, row):
+            if rect[COST] >= best:
+                floor = min(floor, rect[COST])
+                continue
+            mask = ((1 << (rect[R] - rect[L] + 1)) - 1) << rect[L]
+            after = blocked[:]
+            for line in xrange(rect[T], rect[B] + 1):
+                after[line] |= mask
+            placed.append(rect)
+            value, rects = self.search(after, row, houses - 1,
+                                       best - rect[COST],
+                                       cost + rect[COST], placed)
+            placed.pop()
+            if rects is not None:
+                best, best_rects = rect[COST] + value, [rect] + rects
+            else:
+                floor = min(floor, rect[COST] + value)
+        if best_rects is not None:
+            return self.remember(key, best, best_rects)
+        return self.remember(key, max(floor, bound), None)
+
+    def remember(self, key, value, rects):
+        """ record a subproblem result and return it """
+        if len(self.table) >= TABLE_SIZE:
+            self.table.clear()
+        self.table[key] = (value, rects)
+        return value, rects
+
+    def store(self, cost, placed):
+        """ keep a complete covering if it is the cheapest so far """
+        if cost < self.best_cost:
+            self.best_cost = cost
+            self.best = list(placed)
+
+    def candidates(self, blocked, row):
+        """ return the tight rectangles covering the first uncovered berry
+        of row without touching a placed greenhouse, least waste first.
+        every berry before it is covered, so the rectangle's top is row """
+        field = self.field
+        count = field.count
+        free = field.row_masks[row] & ~blocked[row]
+        first = len(bin(free & -free)) - 3
+        taken = blocked[row]
+        rects = []
+        left = first
+        while left >= 0 and not (taken >> left) & 1:
+            right = first
+            while right < field.num_cols and not (taken >> right) & 1:
+                mask = ((1 << (right - left + 1)) - 1) << left
+                bottom = row
+                while bottom < field.num_rows and not blocked[bottom] & mask:
+                    if (count(row, left, bottom, left) and
+                            count(row, right, bottom, right) and
+                            count(bottom, left, bottom, right)):
+                        rects.append(make_rectangle(row, left, bottom, right))
+                    bottom += 1
+                right += 1
+            left -= 1
+        rects.sort(key=lambda r: r[AREA] - count(r[T], r[L], r[B], r[R]))
+        return rects
+
+    def lower_bound(self, blocked, row, houses):
+        """ return a lower bound on the cost of covering the remaining
+        berries with at most houses greenhouses.  with k greenhouses each
+        row and each column is crossed by at most k intervals, so its cost
+        is at least its berries plus the gaps left after opening its k - 1
+        widest gaps """
+        field = self.field
+        by_row = [0] * (houses + 1)
+        by_col = [0] * (houses + 1)
+        fewest = 1
+        col_blocked = [0] * field.num_cols
+        for line in xrange(row, field.num_rows):
+            taken = blocked[line]
+            for col in bits(taken):
+                col_blocked[col] |= 1 << line
+            free = field.row_masks[line] & ~taken
+            if free:
+                fewest = max(fewest,
+                             self.line_bound(free, taken, houses, by_row))
+        for col in xrange(field.num_cols):
+            free = (field.col_masks[col] & ~col_blocked[col]) >> row << row
+            if free:
+                fewest = max(fewest, self.line_bound(free, col_blocked[col],
+                                                     houses, by_col))
+        if fewest > houses:
+            return INFEASIBLE
+        return min([10 * k + max(by_row[k], by_col[k])
+                    for k in xrange(fewest, houses + 1)])
+
+    def line_bound(self, free, taken, houses, totals):
+        """ add the cheapest cover of one line with k intervals to
+        totals[k] for each k; return the fewest intervals possible.  a
+        placed greenhouse between two berries forces an interval break """
+        key = (free, taken)
+        try:
+            groups, costs = self.lines[key]
+        except KeyError:
+            cols = list(bits(free))
+            groups = 1
+            gaps = []
+            for first, second in zip(cols, cols[1:]):
+                between = ((1 << second) - 1) & ~((1 << (first + 1)) - 1)
+                if taken & between:
+                    groups += 1
+                else:
+                    gaps.append(second - first - 1)
+            gaps.sort(reverse=True)
+            span = len(cols) + sum(gaps)
+            limit = self.field.maximum_greenhouses
+            costs = [INFEASIBLE] * (limit + 1)
+            for k in xrange(groups, limit + 1):
+                costs[k] = span - sum(gaps[:k - groups])
+            self.lines[key] = groups, costs
+        for k in xrange(len(totals)):
+            totals[k] += costs[k]
+        return groups
+
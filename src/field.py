@@ -8,12 +8,13 @@ to display a solution, to evaluate a covering, etc.
 """
 
 import sys
+from bisect import bisect_left, bisect_right
 
 from memoize import Memoize
 from rectangle import make_rectangle
 
 LABELS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789abcdefghijklmnopqrstuvwxyz"
-T, L, B, R = 0, 1, 2, 3
+T, L, B, R, AREA = 0, 1, 2, 3, 5
 
 
 class StrawberryField(object):
@@ -24,6 +25,7 @@ class StrawberryField(object):
     partition will exhuastively enumerate an area; sometime is represents only
     the area required to account for greenhouses.
     """
+    sparse = False
 
     def __init__(self, data):
         """ create a field object from the provided problem data """
@@ -39,17 +41,161 @@ class StrawberryField(object):
             self.add_row(row)
         self.root_region = \
             make_rectangle(self.top, self.left, self.bottom, self.right)
+        self.build_index()
+
+    def build_index(self):
+        """ build the summed-area table and the per-row column lists.
+        sat[r][c] holds the number of strawberries above row r and left of
+        column c, so any rectangle can be counted with four lookups.
+        """
+        width = self.num_cols + 1
+        self.sat = [[0] * width]
+        self.row_cols = []
+        self.row_masks = []
+        self.col_masks = [0] * self.num_cols
+        for row in self.rows:
+            cols = [berry[1] for berry in row]
+            self.sat.append(self.sat_line(self.sat[-1], cols))
+            self.row_cols.append(cols)
+            mask = 0
+            for col in cols:
+                mask |= 1 << col
+                self.col_masks[col] |= 1 << len(self.row_masks)
+            self.row_masks.append(mask)
+
+    def sat_line(self, above, cols):
+        """ return the summed-area table line below above for a row with
+        strawberries in cols """
+        width = self.num_cols + 1
+        marks = [0] * width
+        for col in cols:
+            marks[col + 1] = 1
+        line = [0] * width
+        running = 0
+        for idx in xrange(1, width):
+            running += marks[idx]
+            line[idx] = above[idx] + running
+        return line
+
+    def update(self, added=(), removed=()):
+        """ add and remove strawberries in place; return the points that
+        changed.  only the touched rows are rebuilt, and the summed-area
+        table from the first of them down.  cached results for rectangles
+        holding a changed point are dropped, the rest are kept """
+        changed = []
+        for points, present in ((added, True), (removed, False)):
+            for point in points:
+                row, col = point
+                if not (0 <= row < self.num_rows and 0 <= col < self.num_cols):
+                    raise ValueError("%r lies outside the field" % (point,))
+                if self.has_berry(point) != present:
+                    self.row_masks[row] ^= 1 << col
+                    self.col_masks[col] ^= 1 << row
+                    changed.append((row, col))
+        if not changed:
+            return changed
+        rows = sorted(set([row for row, _ in changed]))
+        for row in rows:
+            cols = list(bits(self.row_masks[row]))
+            self.row_cols[row] = cols
+            self.rows[row] = [(row, col) for col in cols]
+        for row in xrange(rows[0], self.num_rows):
+            self.sat[row + 1] = self.sat_line(self.sat[row],
+                                              self.row_cols[row])
+        occupied = [row for row, mask in enumerate(self.row_masks) if mask]
+        spanned = [col for col, mask in enumerate(self.col_masks) if mask]
+        if occupied:
+            self.top, self.bottom = occupied[0], occupied[-1]
+            self.left, self.right = spanned[0], spanned[-1]
+        else:
+            self.top = self.left = sys.maxsize
+            self.bottom = self.right = -1
+        self.root_region = \
+            make_rectangle(self.top, self.left, self.bottom, self.right)
+        self.forget(changed)
+        return changed
+
+    def forget(self, changed):
+        """ drop the cached results that may depend on the changed points """
+        def stale(args):
+            """ true for the arguments of a result that may have changed """
+            rect = args[0] if args else None
+            if not rect:
+                return True
+            for point in changed:
+                if point in rect:
+                    return True
+            return False
+        cls = type(self)
+        cls.feasible_region.forget(self, stale)
+        cls.get_berries_in_rectangle.forget(self, stale)
+
+    def has_berry(self, point):
+        """ return true if there is a strawberry at the point """
+        row, col = point
+        if not (0 <= row < self.num_rows and 0 <= col < self.num_cols):
+            return False
+        return (self.row_masks[row] >> col) & 1 == 1
+
+    def coverage(self, partition):
+        """ return one bitmask per row marking the cells covered by the
+        rectangles of the partition """
+        cover = [0] * self.num_rows
+        for rect in partition:
+            mask = column_mask(rect)
+            for row in xrange(rect[T], rect[B] + 1):
+                cover[row] |= mask
+        return cover
+
+    def uncovered_berries(self, partition):
+        """ return the strawberries not covered by the partition, in row
+        major order """
+        berries = []
+        for row, cover in enumerate(self.coverage(partition)):
+            for col in bits(self.row_masks[row] & ~cover):
+                berries.append((row, col))
+        return berries
+
+    def covers_all(self, partition):
+        """ return true if every strawberry lies in some rectangle """
+        for mask, cover in zip(self.row_masks, self.coverage(partition)):
+            if mask & ~cover:
+                return False
+        return True
+
+    def count(self, top, left, bottom, right):
+        """ return the count of strawberries in the given bounds (inclusive).
+        empty bounds (top > bottom or left > right) count zero """
+        if top > bottom or left > right:
+            return 0
+        upper = self.sat[top]
+        lower = self.sat[bottom + 1]
+        return lower[right + 1] - upper[right + 1] - lower[left] + upper[left]
 
-    @Memoize
     def num_strawberries(self, rectangle):
         """ return the count of strawberries in the rectangle """
-        # return len(self.get_berries_in_rectangle(rectangle))
-        num = 0
-        for i in range(rectangle[T], rectangle[B] + 1):
-            # num += sum([1 for berry in self.rows[i] if berry in rectangle])
-            num += sum([1 for berry in self.rows[i]
-                        if rectangle[L] <= berry[1] <= rectangle[R]])
-        return num
+        return self.count(rectangle[T], rectangle[L],
+                          rectangle[B], rectangle[R])
+
+    def is_full(self, rectangle):
+        """ return true if every cell of the rectangle holds a strawberry """
+        return self.num_strawberries(rectangle) == rectangle[AREA]
+
+    def horizontal_runs(self):
+        """ generate (row, start, length) for each run of two or more
+        strawberries along a row, row by row """
+        for row, mask in enumerate(self.row_masks):
+            for start, length in runs(mask):
+                if length > 1:
+                    yield row, start, length
+
+    def vertical_runs(self):
+        """ generate (col, start, length) for each run of two or more
+        strawberries down a column, column by column """
+        for col, mask in enumerate(self.col_masks):
+            for start, length in runs(mask):
+                if length > 1:
+                    yield col, start, length
 
     def greenhouses(self, partition):
         """ return a list of the greenhouses in a partition """
@@ -61,68 +207,62 @@ class StrawberryField(object):
         return ghs
 
     def list_berries(self, partition):
-        """ helper to set up the start state) """
+        """ helper to set up the start state: pair each berry with the id of
+        the first rectangle containing it, or None """
+        owner = {}
+        claimed = [0] * self.num_rows
+        for idx, rect in enumerate(partition):
+            mask = column_mask(rect)
+            for row in xrange(rect[T], rect[B] + 1):
+                hits = self.row_masks[row] & mask & ~claimed[row]
+                if hits:
+                    claimed[row] |= hits
+                    for col in bits(hits):
+                        owner[(row, col)] = idx
         result = []
         for berry in self.get_berries_in_rectangle(self.root_region):
-            result.append((berry, self._get_rect_id(berry, partition)))
+            result.append((berry, owner.get(berry)))
         return result
 
-    def _get_rect_id(self, berry, partition):
-        """ return the id of the rectangle containing the berry, or None """
-        for idx, rect in enumerate(partition):
-            if berry in rect:
-                return idx
-        return None
+    def display(self, partition, out=None):
+        """ return a string representation of a field: each greenhouse's
+        feasible region in its letter, cells under more than one greenhouse
+        as '*', and uncovered strawberries as '@'.  given a file object,
+        write the rows to it instead and return None """
+        canvas = self.canvas(True)
+        self.paint(canvas, [self.feasible_region(rect) for rect in partition],
+                   "*")
+        return render(canvas, out)
 
-    def display(self, partition):
-        """ return a string representation of a field """
-        berries = []
-        for row in self.rows:
-            for berry in row:
-                berries.append(berry)
-        buf = ""
-        for row in range(0, self.num_rows):
-            for col in range(0, self.num_cols):
-                point = (row, col)
-                # check first
-                dot = True
-                num_assigned = 0
-                chr_assign = "."
-                for rect_id, rect in enumerate(partition):
-                    feasible_rect = self.feasible_region(rect)
-                    if feasible_rect and point in feasible_rect:
-                        if num_assigned == 0:
-                            chr_assign = LABELS[rect_id % len(LABELS)]
-                            dot = False
-                        else:
-                            chr_assign = "*"
-                        num_assigned += 1
-                if dot:
-                    if point in berries:
-                        buf += "@"
-                    else:
-                        buf += "."
-                else:
-                    buf += chr_assign
-            buf += "\n"
-        return buf
-
-    def display_full(self, partition):
-        """ display full paritions, not just feasible regions """
-        buf = ""
-        for row in range(0, self.num_rows):
-            for col in range(0, self.num_cols):
-                point = (row, col)
-                dot = True
-                for rect_id, rect in enumerate(partition):
-                    if point in rect:
-                        buf += LABELS[rect_id % len(LABELS)]
-                        dot = False
-                        break
-                if dot:
-                    buf += "."
-            buf += "\n"
-        return buf
+    def display_full(self, partition, out=None):
+        """ display full paritions, not just feasible regions.  a cell
+        under several rectangles takes the letter of the first """
+        canvas = self.canvas(False)
+        self.paint(canvas, partition, None)
+        return render(canvas, out)
+
+    def canvas(self, berries):
+        """ return one list of characters per row, all '.', with the
+        strawberries marked '@' if berries is true """
+        canvas = [["."] * self.num_cols for _ in xrange(self.num_rows)]
+        if berries:
+            for line, cols in zip(canvas, self.row_cols):
+                for col in cols:
+                    line[col] = "@"
+        return canvas
+
+    def paint(self, canvas, partition, overlap):
+        """ paint each rectangle of the partition onto the canvas once, in
+        its letter.  cells already painted become overlap, or keep their
+        first letter if overlap is None.  empty rectangles are skipped """
+        painted = [0] * self.num_rows
+        for rect_id, rect in enumerate(partition):
+            if not rect:
+                continue
+            label = LABELS[rect_id % len(LABELS)]
+            for row in xrange(rect[T], rect[B] + 1):
+                painted[row] = paint_line(canvas[row], painted[row], rect,
+                                          label, overlap)
 
     @Memoize
     def feasible_region(self, rectangle=None):
@@ -132,21 +272,30 @@ class StrawberryField(object):
         if not rectangle:
             return self.root_region
 
-        berries = self.get_berries_in_rectangle(rectangle)
-        b_zero = [b[0] for b in berries]
-        b_one = [b[1] for b in berries]
-        if berries:
-            origin = (min(b_zero), min(b_one))
-            extent = (max(b_zero), max(b_one))
-            return make_rectangle(origin[0], origin[1], extent[0], extent[1])
-        return None
+        top, left, bottom, right = \
+            rectangle[T], rectangle[L], rectangle[B], rectangle[R]
+        count = self.count
+        if count(top, left, bottom, right) == 0:
+            return None
+        # shrink each side in turn to the first line holding a strawberry
+        top = _lowest(top, bottom,
+                      lambda m: count(top, left, m, right) > 0)
+        left = _lowest(left, right,
+                       lambda m: count(top, left, bottom, m) > 0)
+        bottom = _lowest(top, bottom,
+                         lambda m: count(m + 1, left, bottom, right) == 0)
+        right = _lowest(left, right,
+                        lambda m: count(top, m + 1, bottom, right) == 0)
+        return make_rectangle(top, left, bottom, right)
 
     @Memoize
     def get_berries_in_rectangle(self, rectangle):
         """ get a list of strawberries in the rectangle """
         berries = []
         for i in xrange(rectangle[T], rectangle[B] + 1):
-            berries += [berry for berry in self.rows[i] if berry in rectangle]
+            cols = self.row_cols[i]
+            berries += self.rows[i][bisect_left(cols, rectangle[L]):
+                                    bisect_right(cols, rectangle[R])]
         return berries
 
     def add_row(self, row):
@@ -167,12 +316,67 @@ class StrawberryField(object):
 
     def __str__(self):
         """ display the original field """
-        buf = ""
-        for row in range(self.num_rows):
-            for col in range(self.num_cols):
-                if (row, col) in self.rows[row]:
-                    buf += "@"
-                else:
-                    buf += "."
-            buf += "\n"
-        return buf
+        return render(self.canvas(True))
+
+
+def paint_line(line, painted, rect, label, overlap):
+    """ paint the span of a rectangle onto one row of a canvas, given the
+    bitmask of the row's cells already painted; return the new bitmask """
+    mask = column_mask(rect)
+    taken = painted & mask
+    if not taken:
+        line[rect[L]:rect[R] + 1] = label * (rect[R] - rect[L] + 1)
+    else:
+        for col in xrange(rect[L], rect[R] + 1):
+            if not (taken >> col) & 1:
+                line[col] = label
+            elif overlap is not None:
+                line[col] = overlap
+    return painted | mask
+
+
+def render(canvas, out=None):
+    """ join a canvas into one string, a newline after each row.  given a
+    file object, write it a row at a time and return None """
+    if out is None:
+        return "".join(["".join(line) + "\n" for line in canvas])
+    for line in canvas:
+        out.write("".join(line))
+        out.write("\n")
+    return None
+
+
+def _lowest(low, high, test):
+    """ return the smallest value in [low, high] passing a monotonic test """
+    while low < high:
+        mid = (low + high) // 2
+        if test(mid):
+            high = mid
+        else:
+            low = mid + 1
+    return low
+
+
+def column_mask(rect):
+    """ return the bitmask of the columns spanned by a rectangle """
+    return ((1 << (rect[R] - rect[L] + 1)) - 1) << rect[L]
+
+
+def bits(mask):
+    """ generate the indices of the set bits of a mask, lowest first """
+    while mask:
+        low = mask & -mask
+        yield len(bin(low)) - 3
+        mask ^= low
+
+
+def runs(mask):
+    """ generate (start, length) for each run of set bits in a mask """
+    while mask:
+        low = mask & -mask
+        start = len(bin(low)) - 3
+        shifted = mask >> start
+        end = ~shifted & (shifted + 1)
+        length = len(bin(end)) - 3
+        yield start, length
+        mask &= ~((end - 1) << start)
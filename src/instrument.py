@@ -0,0 +1,130 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Counters and timers for the solver, so a slow field can say why it is slow.
+
+Recording is off by default.  Solver code asks current() for the recorder of
+the problem being solved, once per call rather than once per pair, and does
+nothing more when there is none.  A problem is recorded by solving it inside
+recording():
+
+    with recording() as recorder:
+        ...
+    print recorder.to_json()
+
+The recorder holds running counters, seconds per phase, one entry per
+generation of the search, and the hits, misses and evictions of every
+memoized function during the problem.  profiled() runs a block under cProfile
+and prints the busiest functions when it exits.
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+from memoize import cache_stats
+
+# the recorder of the problem being solved, or None when recording is off
+_CURRENT = None
+
+
+class Recorder(object):
+    """ the counters, timers and generations of one problem """
+
+    def __init__(self):
+        """ start with nothing recorded """
+        self.counters = {}
+        self.seconds = {}
+        self.generations = []
+        self.caches = {}
+
+    def count(self, name, amount=1):
+        """ add amount to a counter """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        """ charge seconds to a phase """
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, name):
+        """ charge the time spent in the block to a phase """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - started)
+
+    def generation(self, **values):
+        """ record one generation of the search """
+        values["generation"] = len(self.generations)
+        self.generations.append(values)
+
+    def as_dict(self):
+        """ return everything recorded as plain values """
+        return {"counters": dict(self.counters),
+                "seconds": dict((name, round(seconds, 6))
+                                for name, seconds in self.seconds.items()),
+                "generations": list(self.generations),
+                "caches": dict(self.caches)}
+
+    def to_json(self):
+        """ return everything recorded as a line of json """
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+
+def current():
+    """ return the active recorder, or None when recording is off """
+    return _CURRENT
+
+
+@contextmanager
+def recording(recorder=None):
+    """ record the block into recorder, a new one if not given.  memoized
+    functions are charged only the lookups made inside the block """
+    global _CURRENT
+    if recorder is None:
+        recorder = Recorder()
+    before = cache_stats()
+    previous, _CURRENT = _CURRENT, recorder
+    try:
+        yield recorder
+    finally:
+        _CURRENT = previous
+        for name, stats in cache_stats().items():
+            old = before.get(name, {})
+            delta = dict((key, stats[key] - old.get(key, 0))
+                         for key in ("hits", "misses", "evictions"))
+            lookups = delta["hits"] + delta["misses"]
+            if lookups:
+                delta["hit_rate"] = round(float(delta["hits"]) / lookups, 4)
+                recorder.caches[name] = delta
+
+
+@contextmanager
+def timed(name):
+    """ charge the block to a phase of the active recorder, if any """
+    recorder = _CURRENT
+    if recorder is None:
+        yield
+        return
+    with recorder.timer(name):
+        yield
+
+
+@contextmanager
+def profiled(out=sys.stderr, sort="cumulative", limit=30):
+    """ run the block under cProfile and print the limit busiest functions,
+    ordered by sort, to out """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats(sort).print_stats(limit)
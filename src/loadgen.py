@@ -0,0 +1,199 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Load generator for the solve service.
+
+Each of --connections clients opens a connection to the service and sends
+problems one at a time, waiting for each reply before sending the next,
+until --requests problems have been answered between them.  Problems come
+from an input file, or are generated as in benchmark.py.  The report gives
+throughput, the 50th and 99th percentile latency and the replies refused or
+failed, by error.
+
+    PATH_TO_PYTHON loadgen.py --port=8765 --connections=8 --requests=500
+
+With --local the generator starts a service of its own on a free port, so a
+run needs nothing else:
+
+    PATH_TO_PYTHON loadgen.py --local --workers=4
+"""
+
+import json
+import math
+import socket
+import sys
+import threading
+import time
+from itertools import count
+from optparse import OptionParser
+
+from benchmark import GENERATORS, make_problem
+from service import DEFAULT_PORT, serve, stop
+from solve_problems import get_problems
+
+
+def percentile(ordered, fraction):
+    """ return the nearest rank percentile of a sorted list """
+    if not ordered:
+        return None
+    rank = max(0, int(math.ceil(fraction * len(ordered))) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Client(threading.Thread):
+    """ one connection, sending a problem and awaiting its reply in turn """
+
+    def __init__(self, address, problems, tickets, timeout_ms):
+        """ send problems, cycling, while tickets last """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.address = address
+        self.problems = problems
+        self.tickets = tickets
+        self.timeout_ms = timeout_ms
+        self.latencies = []
+        self.errors = {}
+
+    def run(self):
+        """ send and wait until the tickets run out """
+        sock = socket.create_connection(self.address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile("r")
+        try:
+            for ident in iter(self.tickets, None):
+                message = {"id": ident,
+                           "problem": self.problems[ident %
+                                                    len(self.problems)]}
+                if self.timeout_ms is not None:
+                    message["timeout_ms"] = self.timeout_ms
+                started = time.time()
+                sock.sendall(json.dumps(message) + "\n")
+                reply = json.loads(reader.readline())
+                self.latencies.append(time.time() - started)
+                if "error" in reply:
+                    error = reply["error"].split(":")[0]
+                    self.errors[error] = self.errors.get(error, 0) + 1
+        finally:
+            reader.close()
+            sock.close()
+
+
+def ticket_counter(total):
+    """ return a thread safe function giving out the numbers 0 to total-1,
+    then None """
+    lock = threading.Lock()
+    numbers = count()
+
+    def take():
+        with lock:
+            number = next(numbers)
+        return number if number < total else None
+    return take
+
+
+def ms(seconds):
+    """ return seconds in milliseconds, rounded, or None """
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def run_load(address, problems, connections, requests, timeout_ms=None):
+    """ send requests problems over connections clients; return a report
+    of the throughput, latencies and errors """
+    tickets = ticket_counter(requests)
+    clients = [Client(address, problems, tickets, timeout_ms)
+               for _ in range(connections)]
+    started = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    seconds = time.time() - started
+    latencies = sorted([latency for client in clients
+                        for latency in client.latencies])
+    errors = {}
+    for client in clients:
+        for error, number in client.errors.items():
+            errors[error] = errors.get(error, 0) + number
+    return {"connections": connections,
+            "requests": len(latencies),
+            "seconds": round(seconds, 6),
+            "throughput": round(len(latencies) / seconds, 3)
+            if seconds > 0 else None,
+            "p50_ms": ms(percentile(latencies, 0.5)),
+            "p99_ms": ms(percentile(latencies, 0.99)),
+            "max_ms": ms(latencies[-1] if latencies else None),
+            "errors": errors}
+
+
+def main():
+    """ entry point """
+    usage = "usage: %prog [options]"
+    parser = OptionParser(usage)
+    parser.add_option("--host", dest="host", default="127.0.0.1",
+                      help="address of the service [default: %default]")
+    parser.add_option("-p", "--port", dest="port", type="int",
+                      default=DEFAULT_PORT,
+                      help="port of the service [default: %default]")
+    parser.add_option("-c", "--connections", dest="connections", type="int",
+                      default=4,
+                      help="clients sending at once [default: %default]")
+    parser.add_option("-n", "--requests", dest="requests", type="int",
+                      default=200,
+                      help="problems to send in all [default: %default]")
+    parser.add_option("-i", "--input", dest="infile", default=None,
+                      help="send the problems of FILENAME")
+    parser.add_option("-k", "--kind", dest="kind", default="random",
+                      type="choice", choices=sorted(GENERATORS),
+                      help="without --input, send generated fields of this "
+                      "kind [default: %default]")
+    parser.add_option("-z", "--size", dest="size", type="int", default=10,
+                      help="size of the generated fields [default: %default]")
+    parser.add_option("--fields", dest="fields", type="int", default=20,
+                      help="distinct fields to generate [default: %default]")
+    parser.add_option("--timeout-ms", dest="timeout_ms", type="float",
+                      default=None,
+                      help="timeout sent with each request")
+    parser.add_option("--local", dest="local", action="store_true",
+                      default=False,
+                      help="start a service on a free local port and load it")
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+                      default=2,
+                      help="workers of the --local service "
+                      "[default: %default]")
+    (options, _) = parser.parse_args()
+    if options.connections < 1 or options.requests < 1:
+        parser.error("--connections and --requests must be at least 1")
+
+    if options.infile is not None:
+        problems = list(get_problems(options.infile))
+    else:
+        problems = [make_problem(options.kind, options.size, seed)
+                    for seed in range(options.fields)]
+    address = (options.host, options.port)
+    server = None
+    if options.local:
+        server, pool = serve(options.host, 0, options.workers)
+        address = server.server_address
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+    try:
+        report = run_load(address, problems, options.connections,
+                          options.requests, options.timeout_ms)
+    finally:
+        if server is not None:
+            stop(server, pool)
+    if server is not None:
+        report["service"] = server.dispatcher.counters
+    print >> sys.stderr, ("%d requests in %.3fs: %.1f/s, p50 %.1fms, "
+                          "p99 %.1fms" % (report["requests"],
+                                          report["seconds"],
+                                          report["throughput"],
+                                          report["p50_ms"],
+                                          report["p99_ms"]))
+    print json.dumps(report, indent=2, sort_keys=True)
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,79 @@ From github:
   https://gist.github.com/267733/8f5d2e3576b6a6f221f6fb7e2e10d395ad7303f9
 
 @author: http://gist.github.com/jefftriplett
+
+Extended with size limits, least-recently-used eviction, per-problem scoping
+and hit/miss/eviction counters so long batch runs do not grow without bound.
 """
 
-import functools
+import weakref
+from contextlib import contextmanager
+
+DEFAULT_MAXSIZE = 1 << 17
+PREV, NEXT, KEY, RESULT = 0, 1, 2, 3
+
+# every decorated function, so scopes and stats can reach all caches
+_REGISTRY = []
+
+
+class LRUCache(object):
+    """ a bounded mapping that evicts the least recently used entry when
+    full.  entries are kept in a circular doubly linked list, most recent
+    last, so lookups and evictions are constant time.  counters are charged
+    to the owning Memoize.
+    """
+
+    def __init__(self, owner, maxsize):
+        """ create an empty cache; maxsize None means unbounded """
+        self.owner = owner
+        self.maxsize = maxsize
+        self.links = {}
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None]
+
+    def __len__(self):
+        """ return the number of cached entries """
+        return len(self.links)
+
+    def get(self, key, func):
+        """ lookup the key; if it doesn't exist, compute and cache it """
+        link = self.links.get(key)
+        root = self.root
+        if link is not None:
+            link[PREV][NEXT] = link[NEXT]
+            link[NEXT][PREV] = link[PREV]
+            last = root[PREV]
+            last[NEXT] = root[PREV] = link
+            link[PREV] = last
+            link[NEXT] = root
+            self.owner.hits += 1
+            return link[RESULT]
+        self.owner.misses += 1
+        result = func()
+        if self.maxsize is not None and len(self.links) >= self.maxsize:
+            oldest = root[NEXT]
+            root[NEXT] = oldest[NEXT]
+            oldest[NEXT][PREV] = root
+            del self.links[oldest[KEY]]
+            self.owner.evictions += 1
+        last = root[PREV]
+        link = [last, root, key, result]
+        last[NEXT] = root[PREV] = link
+        self.links[key] = link
+        return result
+
+    def clear(self):
+        """ drop every entry """
+        self.links.clear()
+        self.root[:] = [self.root, self.root, None, None]
+
+    def discard(self, test):
+        """ drop the entries whose key passes test """
+        for key, link in self.links.items():
+            if test(key):
+                link[PREV][NEXT] = link[NEXT]
+                link[NEXT][PREV] = link[PREV]
+                del self.links[key]
 
 
 class Memoize(object):
@@ -20,34 +90,121 @@ class Memoize(object):
     This came in handy for a few rectangle (greenhouse) -related functions -
     merging, counting strawberries in the rectangle, etc.
 
-    Works for functions and class methods
+    Works for functions and class methods.  Methods get one cache per
+    instance, held through a weak reference so the instance can still be
+    collected.  Each cache holds at most maxsize entries; scoped caches are
+    emptied whenever a problem_scope exits.
 
     """
 
-    def __init__(self, func):
+    def __init__(self, func, maxsize=DEFAULT_MAXSIZE, scoped=True):
         """ create a cache for a function """
         self.func = func
-        self.memoized = {}
-        self.method_cache = {}
+        self.maxsize = maxsize
+        self.scoped = scoped
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.memoized = LRUCache(self, maxsize)
+        self.method_cache = weakref.WeakKeyDictionary()
+        _REGISTRY.append(self)
 
     def __call__(self, *args):
         """ call the function through the wrapper """
-        return self.cache_get(self.memoized, args, lambda: self.func(*args))
+        return self.memoized.get(args, lambda: self.func(*args))
 
     def __get__(self, obj, objtype):
-        """ retrieve a result from the cache """
-        return self.cache_get(
-            self.method_cache,
-            obj,
-            lambda: self.__class__(
-                functools.partial(
-                    self.func,
-                    obj)))
-
-    def cache_get(self, cache, key, func):
-        """ lookup the key (args); if it doesn't exist, cache it """
+        """ return the function bound to the per-instance cache """
+        if obj is None:
+            return self
         try:
-            return cache[key]
+            cache = self.method_cache[obj]
         except KeyError:
-            cache[key] = func()
-            return cache[key]
+            cache = self.method_cache[obj] = LRUCache(self, self.maxsize)
+        return BoundMemo(self.func, obj, cache)
+
+    def clear(self):
+        """ empty the function cache and every instance cache """
+        self.memoized.clear()
+        self.method_cache.clear()
+
+    def forget(self, obj, test):
+        """ drop the results cached for obj whose argument tuple passes
+        test, for when obj changes in place """
+        cache = self.method_cache.get(obj)
+        if cache is not None:
+            cache.discard(test)
+
+    def stats(self):
+        """ return the counters and current size of the cache """
+        size = len(self.memoized)
+        for cache in self.method_cache.values():
+            size += len(cache)
+        name = "%s.%s" % (self.func.__module__, self.func.__name__)
+        return {"name": name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": size,
+                "maxsize": self.maxsize}
+
+
+class BoundMemo(object):
+    """ a memoized method bound to one instance and its cache """
+    __slots__ = ("func", "obj", "cache")
+
+    def __init__(self, func, obj, cache):
+        """ bind func to obj, caching results in cache """
+        self.func = func
+        self.obj = obj
+        self.cache = cache
+
+    def __call__(self, *args):
+        """ call the method through the instance cache """
+        return self.cache.get(args, lambda: self.func(self.obj, *args))
+
+
+def memoize(maxsize=DEFAULT_MAXSIZE, scoped=True):
+    """ decorator factory for caches that need non-default settings:
+
+    @memoize(maxsize=1000, scoped=False)
+    def fun(x):
+        ...
+    """
+    return lambda func: Memoize(func, maxsize, scoped)
+
+
+def set_maxsize(maxsize):
+    """ bound every cache, new and existing, to maxsize entries; caches
+    already larger are emptied """
+    for memo in _REGISTRY:
+        memo.maxsize = maxsize
+        for cache in [memo.memoized] + memo.method_cache.values():
+            cache.maxsize = maxsize
+            if maxsize is not None and len(cache) > maxsize:
+                cache.clear()
+
+
+def clear_scoped():
+    """ empty every scoped cache """
+    for memo in _REGISTRY:
+        if memo.scoped:
+            memo.clear()
+
+
+@contextmanager
+def problem_scope():
+    """ solve one problem; scoped caches are emptied on the way out """
+    try:
+        yield
+    finally:
+        clear_scoped()
+
+
+def cache_stats():
+    """ return the stats of every memoized function, keyed by name """
+    result = {}
+    for memo in _REGISTRY:
+        stats = memo.stats()
+        result[stats["name"]] = stats
+    return result
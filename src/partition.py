@@ -0,0 +1,120 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+A partition of the field into greenhouses, as the agglomerative search
+holds it.
+
+A search generation makes many successors of each partition, each one merge
+away from its parent, and keeps only a beam of them.  A successor therefore
+records just its parent's greenhouses, the two it merged and the merged
+greenhouse, along with its score and hash, each worked out from the
+parent's in constant time.  Its own greenhouses are built only if it is
+expanded in turn, and then it lets go of its parent.  They come in the
+parent's order, less the merged pair, with the merged greenhouse last.  The
+search shuffles that list before trying its pairs, so this order, not just
+the seed, decides which covering a seeded search finds.
+
+The hash is Zobrist style: each greenhouse has a fixed pseudo random key
+and a partition's key is the exclusive or of its greenhouses' keys, so a
+merge updates it with three operations.  Keys are derived from the corners
+alone, so every process gives a greenhouse the same key.  Partitions with
+the same key, score and number of greenhouses are taken to be equal; with
+62 bit keys a false match is too unlikely to matter.
+"""
+
+from functools import total_ordering
+
+from memoize import Memoize
+
+T, L, B, R, COST = 0, 1, 2, 3, 4
+KEY_BITS = 62
+_MASK = (1 << KEY_BITS) - 1
+_MASK64 = (1 << 64) - 1
+
+
+@Memoize
+def greenhouse_key(rect):
+    """ return the Zobrist key of a greenhouse: its corners packed and
+    mixed by the splitmix64 finalizer """
+    value = (((rect[T] * 0x10001 + rect[L]) << 32) ^
+             (rect[B] * 0x10001 + rect[R])) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return int((value ^ (value >> 31)) & _MASK)
+
+
+@total_ordering
+class Partition(object):
+    """ a set of greenhouses with its score and key.  build one from a list
+    of greenhouses, and its successors with merge() """
+    __slots__ = ("score", "key", "size", "_houses", "_order", "_merge")
+
+    def __init__(self, houses=()):
+        """ a partition of these greenhouses """
+        self._houses = tuple(houses)
+        self.score = sum([rect[COST] for rect in self._houses])
+        key = 0
+        for rect in self._houses:
+            key ^= greenhouse_key(rect)
+        self.key = key
+        self.size = len(self._houses)
+        self._order = self._merge = None
+
+    def merge(self, order, house1, house2, merged):
+        """ return the successor with house1 and house2 replaced by merged.
+        order holds this partition's greenhouses, as houses() returned
+        them; the successor keeps it, unchanged, until it is expanded """
+        successor = Partition.__new__(Partition)
+        successor.score = (self.score - house1[COST] - house2[COST] +
+                           merged[COST])
+        successor.key = (self.key ^ greenhouse_key(house1) ^
+                         greenhouse_key(house2) ^ greenhouse_key(merged))
+        successor.size = self.size - 1
+        successor._houses = None
+        successor._order = order
+        successor._merge = (house1, house2, merged)
+        return successor
+
+    def houses(self):
+        """ return a new list of the greenhouses """
+        if self._houses is None:
+            house1, house2, merged = self._merge
+            houses = [rect for rect in self._order
+                      if rect is not house1 and rect is not house2]
+            houses.append(merged)
+            self._houses = tuple(houses)
+            self._order = self._merge = None
+        return list(self._houses)
+
+    def __len__(self):
+        """ return the number of greenhouses """
+        return self.size
+
+    def __hash__(self):
+        """ return the key """
+        return self.key
+
+    def __eq__(self, other):
+        """ return true if both hold the same greenhouses """
+        return (self.key == other.key and self.score == other.score and
+                self.size == other.size)
+
+    def __ne__(self, other):
+        """ return true unless both hold the same greenhouses """
+        return not self == other
+
+    def __lt__(self, other):
+        """ an arbitrary but fixed order, for breaking ties in a heap """
+        return (self.score, self.key) < (other.score, other.key)
+
+    def __getstate__(self):
+        """ pickle the greenhouses, not the parent's """
+        return self.score, self.key, self.houses()
+
+    def __setstate__(self, state):
+        """ unpickle """
+        self.score, self.key, houses = state
+        self._houses = tuple(houses)
+        self.size = len(houses)
+        self._order = self._merge = None
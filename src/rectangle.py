@@ -7,6 +7,9 @@ from collections import namedtuple
 from memoize import Memoize
 
 T, L, B, R = 0, 1, 2, 3  # TOP, LEFT, BOTTOM, RIGHT indices
+GREENHOUSE_COST = 10  # the fixed part of a greenhouse's cost
+GRID_SIZE = 8  # side of a GridIndex bucket, in cells
+GRID_MIN_RECTANGLES = 64  # below this, a plain scan beats the buckets
 
 
 @Memoize
@@ -14,7 +17,7 @@ def make_rectangle(top, left, bottom, right):
     """ make a rectangle using layout members """
     a = (bottom - top + 1) * (right - left + 1)
     return Rectangle(top, left, bottom, right,
-                     a + 10,  # cost
+                     a + GREENHOUSE_COST,  # cost
                      a,)  # area
 
 
@@ -43,7 +46,101 @@ class Rectangle(
         bottom = self[B] if self[B] > other[B] else other[B]
         right = self[R] if self[R] > other[R] else other[R]
         a = (bottom - top + 1) * (right - left + 1)
-        return self._make((top, left, bottom, right, a + 10, a, ))
+        return self._make((top, left, bottom, right,
+                           a + GREENHOUSE_COST, a, ))
+
+
+class GridIndex(object):
+    """ a uniform grid of buckets over a set of rectangles.  each rectangle
+    is listed in every bucket it touches, so the rectangles near a box are
+    found without scanning the whole set.  small sets are cheaper to scan,
+    so an index built over fewer than GRID_MIN_RECTANGLES keeps no buckets.
+    on a large field the buckets grow so there are about as many of them as
+    rectangles, however far apart the rectangles are.
+    """
+
+    def __init__(self, rectangles=(), size=GRID_SIZE):
+        """ index the rectangles in buckets of at least size x size cells """
+        rectangles = list(rectangles)
+        if len(rectangles) < GRID_MIN_RECTANGLES:
+            size = None
+        else:
+            extent = max(max([rect[B] for rect in rectangles]) -
+                         min([rect[T] for rect in rectangles]),
+                         max([rect[R] for rect in rectangles]) -
+                         min([rect[L] for rect in rectangles])) + 1
+            size = max(size, extent // int(len(rectangles) ** 0.5))
+        self.size = size
+        self.buckets = {}
+        self.rects = set()
+        for rect in rectangles:
+            self.add(rect)
+
+    def __contains__(self, rect):
+        """ return true if the rectangle is indexed """
+        return rect in self.rects
+
+    def __len__(self):
+        """ return the number of indexed rectangles """
+        return len(self.rects)
+
+    def _cells(self, rect):
+        """ generate the bucket keys a rectangle touches """
+        size = self.size
+        for row in xrange(rect[T] // size, rect[B] // size + 1):
+            for col in xrange(rect[L] // size, rect[R] // size + 1):
+                yield row, col
+
+    def add(self, rect):
+        """ add a rectangle to the index """
+        self.rects.add(rect)
+        if self.size is None:
+            return
+        buckets = self.buckets
+        for cell in self._cells(rect):
+            try:
+                buckets[cell].append(rect)
+            except KeyError:
+                buckets[cell] = [rect]
+
+    def remove(self, rect):
+        """ remove a rectangle from the index """
+        self.rects.remove(rect)
+        if self.size is None:
+            return
+        for cell in self._cells(rect):
+            self.buckets[cell].remove(rect)
+
+    def count_overlaps(self, box, limit):
+        """ count the rectangles intersecting box, stopping as soon as the
+        count exceeds limit.  a rectangle spanning several buckets is only
+        counted in the bucket holding the top left cell of its intersection
+        with box """
+        size = self.size
+        count = 0
+        if size is None:
+            for rect in self.rects:
+                if (rect[B] < box[T] or rect[T] > box[B] or
+                        rect[R] < box[L] or rect[L] > box[R]):
+                    continue
+                count += 1
+                if count > limit:
+                    return count
+            return count
+        for cell in self._cells(box):
+            for rect in self.buckets.get(cell, ()):
+                if (rect[B] < box[T] or rect[T] > box[B] or
+                        rect[R] < box[L] or rect[L] > box[R]):
+                    continue
+                top = rect[T] if rect[T] > box[T] else box[T]
+                left = rect[L] if rect[L] > box[L] else box[L]
+                if (top // size, left // size) != cell:
+                    continue
+                count += 1
+                if count > limit:
+                    return count
+        return count
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,403 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+A local solve service, so a caller with many fields pays for the solver's
+start up once rather than once per field.
+
+The service listens on a TCP socket and speaks lines of JSON.  Each request
+is a line holding an id, the problem's input lines and, optionally, a
+timeout in milliseconds:
+
+    {"id": 7, "problem": ["4", "..@@..", "..@@.."], "timeout_ms": 500}
+
+and each reply is a line holding the same id and either the result of
+solve_problem, less the picture, or an error:
+
+    {"id": 7, "cost": 24, "greenhouses": [[0, 2, 1, 3]], ...}
+    {"id": 8, "error": "busy"}
+
+A connection may send many requests without waiting; replies come back as
+problems are solved, not necessarily in order.
+
+Problems are solved in a pool of worker processes that live as long as the
+service, so imports, NumPy and any solution store stay warm.  A dispatcher
+takes requests off a bounded queue and sends small ones to the pool in
+batches, one task per batch, while a large field goes alone.  At most two
+batches per worker are outstanding; past that requests wait in the queue,
+and once the queue is full new ones are refused as busy.  A request's
+timeout runs from its arrival: one still waiting when it expires is refused,
+and one that starts in time gets what is left as the deadline of its search,
+returning the best covering found so far as incomplete.
+
+    PATH_TO_PYTHON service.py --port=8765 --workers=4
+"""
+
+import json
+import signal
+import sys
+import threading
+import time
+from copy import copy
+from multiprocessing import Pool
+from optparse import OptionParser
+from Queue import Empty, Full, Queue
+from SocketServer import StreamRequestHandler, ThreadingTCPServer
+
+from solve_problems import BEAM_WIDTH, Settings, reseed, solve_problem
+from store import DEFAULT_MAX_ENTRIES
+
+DEFAULT_PORT = 8765
+BATCH_SIZE = 16
+BATCH_CELLS = 2500  # a field this large or larger is sent on its own
+BATCH_WINDOW = 0.005
+QUEUE_SIZE = 256
+BATCHES_PER_WORKER = 2
+
+
+def init_worker():
+    """ pool initializer: reseed, and leave SIGINT to the service """
+    reseed()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def solve_batch(batch):
+    """ solve each (data, settings, expires) of a batch in turn; return a
+    result or an error for each.  expires is the time after which the
+    problem is not worth starting, or None.  this lives at module level so
+    a process pool can run it """
+    results = []
+    for data, settings, expires in batch:
+        if expires is not None:
+            left = expires - time.time()
+            if left <= 0:
+                results.append({"error": "timeout"})
+                continue
+            settings = copy(settings)
+            if settings.deadline is None or settings.deadline > left:
+                settings.deadline = left
+        try:
+            results.append(solve_problem(data, settings, picture=False))
+        except Exception, error:  # a bad field must not take the worker
+            results.append({"error": "%s: %s" % (type(error).__name__,
+                                                 error)})
+    return results
+
+
+class Request(object):
+    """ a problem waiting to be solved, and the connection to reply on """
+
+    def __init__(self, ident, data, timeout, connection):
+        """ note the arrival time; timeout is in seconds, or None """
+        self.ident = ident
+        self.data = data
+        self.cells = sum([len(line) for line in data[1:]])
+        self.arrived = time.time()
+        self.expires = None if timeout is None else self.arrived + timeout
+        self.connection = connection
+
+    def reply(self, result):
+        """ send the result back, tagged with the request's id """
+        result = dict(result)
+        result["id"] = self.ident
+        self.connection.send(result, answers=True)
+
+
+class Dispatcher(object):
+    """ gather queued requests into batches and hand them to the pool """
+
+    def __init__(self, pool, settings, workers, batch_size=BATCH_SIZE,
+                 batch_cells=BATCH_CELLS, batch_window=BATCH_WINDOW,
+                 queue_size=QUEUE_SIZE):
+        """ start with an empty queue and every batch slot free """
+        self.pool = pool
+        self.settings = settings
+        self.batch_size = batch_size
+        self.batch_cells = batch_cells
+        self.batch_window = batch_window
+        self.queue = Queue(queue_size)
+        self.slots = threading.Semaphore(BATCHES_PER_WORKER * workers)
+        self.lock = threading.Lock()
+        self.counters = {"accepted": 0, "busy": 0, "solved": 0,
+                         "timeout": 0, "errors": 0, "batches": 0}
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def count(self, name, amount=1):
+        """ add amount to a counter """
+        with self.lock:
+            self.counters[name] += amount
+
+    def submit(self, request):
+        """ queue a request, or refuse it as busy if the queue is full """
+        try:
+            self.queue.put_nowait(request)
+        except Full:
+            self.count("busy")
+            request.reply({"error": "busy"})
+            return
+        self.count("accepted")
+
+    def start(self):
+        """ start dispatching """
+        self.thread.start()
+
+    def stop(self):
+        """ stop dispatching once the requests queued so far are sent """
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        """ take a free slot, then a batch, then send it to the pool.
+        while every slot is taken the queue fills, so batches grow with
+        the load """
+        while True:
+            self.slots.acquire()
+            batch = self.next_batch()
+            if batch is None:
+                return
+            now = time.time()
+            live = []
+            for request in batch:
+                if request.expires is not None and request.expires <= now:
+                    self.count("timeout")
+                    request.reply({"error": "timeout"})
+                else:
+                    live.append(request)
+            if not live:
+                self.slots.release()
+                continue
+            tasks = [(request.data, self.settings, request.expires)
+                     for request in live]
+            self.count("batches")
+            self.pool.apply_async(solve_batch, (tasks,),
+                                  callback=self.finisher(live))
+
+    def next_batch(self):
+        """ return the requests of the next batch, or None once stopped.
+        a batch closes when it is full, when it holds batch_cells cells or
+        batch_window seconds after its first request """
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        cells = first.cells
+        closes = time.time() + self.batch_window
+        while len(batch) < self.batch_size and cells < self.batch_cells:
+            wait = closes - time.time()
+            if wait <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=wait)
+            except Empty:
+                break
+            if request is None:
+                self.queue.put(None)
+                break
+            batch.append(request)
+            cells += request.cells
+        return batch
+
+    def finisher(self, batch):
+        """ return the pool callback replying to the requests of a batch """
+        def finish(results):
+            self.slots.release()
+            for request, result in zip(batch, results):
+                if result.get("error") == "timeout":
+                    self.count("timeout")
+                elif "error" in result:
+                    self.count("errors")
+                else:
+                    self.count("solved")
+                request.reply(result)
+        return finish
+
+
+class Connection(object):
+    """ the reply side of a client connection """
+
+    def __init__(self, out):
+        """ write replies to out """
+        self.out = out
+        self.lock = threading.Condition()
+        self.pending = 0
+        self.closed = False
+
+    def expect(self):
+        """ note a request waiting for its reply """
+        with self.lock:
+            self.pending += 1
+
+    def send(self, result, answers=False):
+        """ write one reply as a line of json; answers is true if it is
+        the reply to an expected request """
+        line = json.dumps(result, sort_keys=True) + "\n"
+        with self.lock:
+            if not self.closed:
+                try:
+                    self.out.write(line)
+                    self.out.flush()
+                except (IOError, OSError):  # the client went away
+                    self.closed = True
+            if answers:
+                self.pending -= 1
+            self.lock.notify_all()
+
+    def drain(self):
+        """ wait for every request to get its reply """
+        with self.lock:
+            while self.pending > 0:
+                self.lock.wait()
+
+
+class SolveHandler(StreamRequestHandler):
+    """ read requests off a connection until the client closes it """
+
+    def handle(self):
+        """ queue each request line, then wait for the replies """
+        dispatcher = self.server.dispatcher
+        connection = Connection(self.wfile)
+        try:
+            for line in iter(self.rfile.readline, ""):
+                if not line.strip():
+                    continue
+                request = self.parse(line, connection)
+                if request is not None:
+                    connection.expect()
+                    dispatcher.submit(request)
+        finally:
+            connection.drain()
+
+    def parse(self, line, connection):
+        """ return the request on a line, or None after replying with the
+        reason it is malformed """
+        try:
+            message = json.loads(line)
+            ident = message.get("id")
+            data = [str(row) for row in message["problem"]]
+            timeout = message.get("timeout_ms", self.server.timeout_ms)
+            if timeout is not None:
+                timeout = float(timeout) / 1000.0
+        except (ValueError, KeyError, TypeError, AttributeError), error:
+            connection.send({"id": None,
+                             "error": "bad request: %s" % error})
+            return None
+        if len(data) < 2:
+            connection.send({"id": ident,
+                             "error": "bad request: no field"})
+            return None
+        return Request(ident, data, timeout, connection)
+
+
+class SolveServer(ThreadingTCPServer):
+    """ a thread per connection, one dispatcher and one pool for all """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, dispatcher, timeout_ms=None):
+        """ listen on address; timeout_ms applies to requests giving none """
+        ThreadingTCPServer.__init__(self, address, SolveHandler)
+        self.dispatcher = dispatcher
+        self.timeout_ms = timeout_ms
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=2, settings=None,
+          timeout_ms=None, **batching):
+    """ return a started server and its pool; call serve_forever() on the
+    server, and shutdown() and stop() to finish.  port 0 picks a free
+    port, found in server.server_address """
+    if settings is None:
+        settings = Settings()
+    pool = Pool(workers, init_worker)
+    dispatcher = Dispatcher(pool, settings, workers, **batching)
+    server = SolveServer((host, port), dispatcher, timeout_ms)
+    dispatcher.start()
+    return server, pool
+
+
+def stop(server, pool):
+    """ stop a server started by serve() and its pool """
+    server.shutdown()
+    server.server_close()
+    server.dispatcher.stop()
+    pool.close()
+    pool.join()
+
+
+def main():
+    """ entry point """
+    usage = "usage: %prog [options]"
+    parser = OptionParser(usage)
+    parser.add_option("--host", dest="host", default="127.0.0.1",
+                      help="address to listen on [default: %default]")
+    parser.add_option("-p", "--port", dest="port", type="int",
+                      default=DEFAULT_PORT,
+                      help="port to listen on [default: %default]")
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+                      default=2,
+                      help="solve in N processes [default: %default]")
+    parser.add_option("--batch-size", dest="batch_size", type="int",
+                      default=BATCH_SIZE,
+                      help="problems sent to a worker at once "
+                      "[default: %default]")
+    parser.add_option("--batch-cells", dest="batch_cells", type="int",
+                      default=BATCH_CELLS,
+                      help="close a batch once it holds N cells "
+                      "[default: %default]")
+    parser.add_option("--batch-ms", dest="batch_ms", type="float",
+                      default=BATCH_WINDOW * 1000,
+                      help="wait up to N milliseconds to fill a batch "
+                      "[default: %default]")
+    parser.add_option("--queue-size", dest="queue_size", type="int",
+                      default=QUEUE_SIZE,
+                      help="requests waiting before new ones are refused "
+                      "[default: %default]")
+    parser.add_option("--timeout-ms", dest="timeout_ms", type="float",
+                      default=None,
+                      help="timeout of requests that give none")
+    parser.add_option("-b", "--beam-width", dest="beam_width", type="int",
+                      default=BEAM_WIDTH,
+                      help="successors kept per generation [default: "
+                      "%default]")
+    parser.add_option("--seed", dest="seed", type="int", default=None,
+                      help="seed the search for reproducible results")
+    parser.add_option("--store", dest="store", default=None,
+                      help="reuse and keep solutions in the SQLite file "
+                      "FILENAME")
+    parser.add_option("--store-size", dest="store_size", type="int",
+                      default=DEFAULT_MAX_ENTRIES,
+                      help="solutions kept in the store [default: %default]")
+    (options, _) = parser.parse_args()
+    if options.workers < 1:
+        parser.error("--workers must be at least 1")
+    if options.batch_size < 1 or options.queue_size < 1:
+        parser.error("--batch-size and --queue-size must be at least 1")
+
+    settings = Settings(beam_width=options.beam_width, seed=options.seed,
+                        store=options.store, store_size=options.store_size)
+    server, pool = serve(options.host, options.port, options.workers,
+                         settings, options.timeout_ms,
+                         batch_size=options.batch_size,
+                         batch_cells=options.batch_cells,
+                         batch_window=options.batch_ms / 1000.0,
+                         queue_size=options.queue_size)
+    # serve_forever runs in its own thread so the main thread is free to
+    # take SIGINT and SIGTERM and shut down cleanly
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    print >> sys.stderr, "listening on %s:%d" % server.server_address
+    finished = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: finished.set())
+    try:
+        while not finished.is_set():
+            finished.wait(1)
+    except KeyboardInterrupt:
+        pass
+    stop(server, pool)
+    thread.join()
+    print >> sys.stderr, json.dumps(server.dispatcher.counters,
+                                    sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
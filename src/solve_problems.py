@@ -50,17 +50,48 @@ producing a total score of 1465.
 @author: clifford.lyon@gmail.com
 
 """
+import json
+import os
 import random
+import signal
 import sys
-from itertools import combinations
+import threading
+import time
+from array import array
+from copy import copy
+from functools import partial
+from hashlib import md5
+from heapq import heappush, heapreplace
+from itertools import combinations, count, imap
+from multiprocessing import Pool, RawValue
 from optparse import OptionParser
+from Queue import Queue
 
+import arrays
+from checkpoint import DEFAULT_SECONDS, Checkpoint, checkpoint_path
+from components import berry_groups, cheapest_combination, collapse, place
+from exact import solve_exact
 from field import StrawberryField
-from memoize import Memoize
-from rectangle import make_rectangle
+from instrument import current, profiled, recording, timed
+from memoize import Memoize, problem_scope
+from partition import Partition
+from rectangle import GREENHOUSE_COST, GridIndex, make_rectangle
+from sparse import SparseField, SparseProblem, load_problems
+from store import DEFAULT_MAX_ENTRIES, SolutionStore, field_key, \
+    open_store
 
 T, L, B, R, COST, AREA = 0, 1, 2, 3, 4, 5
-MAX_SUCCESSORS = 100
+# counters charged to each generation of the search
+EXPANSION_COUNTERS = ("expanded", "pairs", "blocked", "overlapping", "pruned",
+                      "offered")
+BEAM_WIDTH = 100
+BLOCKED_PAIRS = 1 << 17  # pairs remembered by a search before starting over
+VECTOR_MIN_CELLS = 400  # smaller fields build their start state faster
+VECTOR_MIN_HOUSES = 16  # smaller partitions try their pairs faster one by one
+# bump when a change alters the coverings found, to retire stored solutions
+STORE_VERSION = 3
+TIE_BREAKS = ("random", "first", "largest")
+FRONTIERS = ("ties", "beam")
 
 
 class BestSolution(object):
@@ -81,10 +112,210 @@ class BestSolution(object):
         """ return the best solution """
         return self._solution
 
+    def score(self):
+        """ return the score of the best solution """
+        return self._score
 
-def pairs(seq):
+
+class CancelFlag(object):
+    """ a flag that stops a search once set.  setting it is a single
+    assignment, so another thread or a signal handler may do it at any
+    time.  a threading.Event, or a multiprocessing.Event set from another
+    process, can stand in for it """
+
+    def __init__(self):
+        """ create a flag that is not set """
+        self._set = False
+
+    def set(self):
+        """ ask the search to stop """
+        self._set = True
+
+    def clear(self):
+        """ let the next search run """
+        self._set = False
+
+    def is_set(self):
+        """ return true if the search should stop """
+        return self._set
+
+
+# cancels the problem this process is solving; see cancel_current
+CANCEL = CancelFlag()
+
+
+class Budget(object):
+    """ the limits of one search: a deadline in seconds, a number of
+    generations and a cancel flag, each optional.  once any of them runs
+    out the budget stays exhausted and agglomerate returns the best
+    partition stored so far.  the limits hold for one run: a search
+    resumed from a checkpoint starts them afresh, and keeps the
+    generations spent before it in resumed """
+
+    def __init__(self, seconds=None, generations=None, cancel=None):
+        """ start the clock """
+        self.deadline = None
+        if seconds is not None:
+            self.deadline = time.time() + seconds
+        self.generations = generations
+        self.cancel = cancel
+        self.spent = 0
+        self.resumed = 0
+        self.stopped = False
+
+    def spend(self):
+        """ charge one generation """
+        self.spent += 1
+
+    def exhausted(self):
+        """ return true, from now on, if any limit has run out """
+        if not self.stopped:
+            self.stopped = (
+                (self.generations is not None and
+                 self.spent >= self.generations) or
+                (self.deadline is not None and
+                 time.time() >= self.deadline) or
+                (self.cancel is not None and self.cancel.is_set()))
+        return self.stopped
+
+
+class BlockedPairs(object):
+    """ pairs of greenhouses that can never be merged on a field, because
+    the box around them holds a strawberry neither of them holds.  every
+    partition covers that strawberry with some third greenhouse, which the
+    merge would overlap.  the partitions of a search share most of their
+    greenhouses with each other and with their parents, so a pair found
+    blocked once is skipped in every other partition of the search, in
+    this generation and later ones, without a merge or an overlap check.
+    at most size pairs are held; a full table starts over """
+
+    def __init__(self, field, size=BLOCKED_PAIRS):
+        """ create an empty table for a field """
+        self.field = field
+        self.size = size
+        self.pairs = set()
+
+    def __contains__(self, pair):
+        """ return true if the pair is known to be blocked """
+        return pair in self.pairs
+
+    def check(self, house1, house2, merged):
+        """ remember the pair if a strawberry of the field blocks it for
+        good.  house1 and house2 are disjoint, so together they hold the
+        sum of their strawberries """
+        field = self.field
+        if field.num_strawberries(merged) > (field.num_strawberries(house1) +
+                                             field.num_strawberries(house2)):
+            if len(self.pairs) >= self.size:
+                self.pairs.clear()
+            self.pairs.add((house1, house2))
+            self.pairs.add((house2, house1))
+
+
+class Beam(object):
+    """ the best partitions seen in one generation, at most width of them.
+    the heap keeps the worst partition on top so it can be replaced
+    cheaply.  the frontier decides which partitions compete:
+
+    ties - only partitions tying the best score; the beam is full, and the
+        generation ends, once width of them are found
+    beam - the width best partitions, tied or not
+
+    partitions with equal scores are ranked by the tie break:
+
+    random - a random draw
+    first - the partition found first
+    largest - the partition whose newest greenhouse is largest
+    """
+
+    def __init__(self, width=BEAM_WIDTH, tie_break="random", rng=random,
+                 frontier="ties"):
+        """ create an empty beam """
+        self.width = width
+        self.tie_break = tie_break
+        self.rng = rng
+        self.ties = frontier == "ties"
+        self.best = sys.maxsize
+        self.heap = []
+        self.members = set()
+        self.found = 0
+
+    def full(self):
+        """ return true if a ties beam has all the successors it needs """
+        return self.ties and len(self.heap) >= self.width
+
+    def threshold(self):
+        """ return the worst score that may still enter the beam """
+        if self.ties:
+            return self.best
+        if len(self.heap) < self.width:
+            return sys.maxsize
+        return -self.heap[0][0]
+
+    def rank(self, new_house):
+        """ return the tie break key of a partition; larger is better """
+        self.found += 1
+        if self.tie_break == "first":
+            return -self.found
+        if self.tie_break == "largest":
+            return new_house[AREA]
+        return self.rng.random()
+
+    def offer(self, partition, new_house):
+        """ add a partition if it is among the best width seen """
+        if partition in self.members or self.width < 1:
+            return
+        score = partition.score
+        if self.ties:
+            if score > self.best:
+                return
+            if score < self.best:
+                self.best = score
+                self.heap = []
+                self.members = set()
+        item = (-score, self.rank(new_house), partition)
+        if len(self.heap) < self.width:
+            heappush(self.heap, item)
+        elif item > self.heap[0]:
+            self.members.discard(heapreplace(self.heap, item)[2])
+        else:
+            return
+        self.members.add(partition)
+
+    def merge(self, items):
+        """ offer the heap items of another beam to this one """
+        for item in items:
+            if item[2] in self.members:
+                continue
+            if self.ties:
+                if -item[0] > self.best:
+                    continue
+                if -item[0] < self.best:
+                    self.best = -item[0]
+                    self.heap = []
+                    self.members = set()
+            if len(self.heap) < self.width:
+                heappush(self.heap, item)
+            elif item > self.heap[0]:
+                self.members.discard(heapreplace(self.heap, item)[2])
+            else:
+                continue
+            self.members.add(item[2])
+
+    def best_score(self):
+        """ return the best score in the beam """
+        if not self.heap:
+            return sys.maxsize
+        return -max(self.heap)[0]
+
+    def partitions(self):
+        """ return the partitions, best first """
+        return [item[2] for item in sorted(self.heap, reverse=True)]
+
+
+def pairs(seq, rng=random):
     """ generate pairs of items in a list.  list order is randomized. """
-    random.shuffle(seq)
+    rng.shuffle(seq)
     for pair in combinations(seq, 2):
         yield pair
 
@@ -92,44 +323,179 @@ def pairs(seq):
 def get_problems(infile="../data/rectangles.txt"):
     """ return array of data for the specific problem
     the first element is the maximum number of greenhouses.  the rest
-    of the elements are the input data for the strawberry field
+    of the elements are the input data for the strawberry field.
+    infile is a path, "-" for standard input, or an open file.  problems
+    are yielded as soon as their closing blank line is read, so a pipe
+    can feed problems in as they are produced
     """
-    fh = open(infile, "r")
+    if infile == "-":
+        fh = sys.stdin
+    elif isinstance(infile, basestring):
+        fh = open(infile, "r")
+    else:
+        fh = infile
     buf = []
-    for line in fh:
-        line = line.strip()
-        if line == "":
-            if buf:
-                yield buf
-            buf = []
-        elif line.strip():
-            buf.append(line)
-    if buf:
-        yield buf
-
-
-def agglomerate(field, partition, goal):
-    """ combine greenhouses until we're done """
-    greenhouse_list = partition[:]
-    num_greenhouses = len(greenhouse_list)
-    successors = [partition]
+    try:
+        # readline rather than iteration: a file's iterator reads ahead
+        # and would hold back problems already sitting in a pipe
+        for line in iter(fh.readline, ""):
+            line = line.strip()
+            if line == "":
+                if buf:
+                    yield buf
+                buf = []
+            elif line.strip():
+                buf.append(line)
+        if buf:
+            yield buf
+    finally:
+        if fh is not infile and fh is not sys.stdin:
+            fh.close()
+
+
+def agglomerate(field, partition, goal, pool=None, beam_width=BEAM_WIDTH,
+                tie_break="random", rng=random, frontier="ties",
+                budget=None, curve=None, checkpoint=None):
+    """ combine greenhouses until we're done.  each generation keeps a beam
+    of at most beam_width successors; a pool, if given, expands each
+    generation in parallel.  a budget, if given, may stop the search early;
+    budget.stopped then tells the caller the result was cut short.
+
+    partitions that cannot lead to a better covering than the best stored
+    are dropped, and once none is left the search is over: it would only
+    go on to find coverings it could not keep.  given a dict as curve, the
+    search instead runs down to the goal and fills curve with the cheapest
+    covering found with each number of greenhouses up to the limit.
+
+    a checkpoint, if given, is saved when due and when the budget stops the
+    search.  if it holds a saved state the search resumes from there and
+    partition is not used """
     best_solution = BestSolution()
-    best_solution.store(partition,
-                        get_score(partition),
-                        field.maximum_greenhouses)
-
+    if checkpoint is not None and checkpoint.state is not None:
+        successors = resume_search(checkpoint.state, best_solution, rng,
+                                   budget, field.maximum_greenhouses)
+    else:
+        start = Partition(partition)
+        successors = [start]
+        best_solution.store(start, start.score, field.maximum_greenhouses)
+    num_greenhouses = len(successors[0])
+    cheapest = {num_greenhouses: successors[0]}
+    blocked = BlockedPairs(field)
+    vector = arrays.available() and not field.sparse
+
+    recorder = current()
     while True:
         if num_greenhouses <= goal:
             break
-        score, _successors = successors_by_agglomeration(successors)
+        if budget is not None and budget.exhausted():
+            if checkpoint is not None:
+                checkpoint.save(search_state(successors, best_solution, rng,
+                                             budget))
+            break
+        best_score = best_solution.score() if curve is None else sys.maxsize
+        successors = [candidate for candidate in successors
+                      if lower_bound(candidate, goal) < best_score]
+        if not successors:
+            if recorder is not None:
+                recorder.count("bounded")
+            break
+        if recorder is not None:
+            started = time.time()
+            before = dict(recorder.counters)
+        score, _successors = successors_by_agglomeration(
+            successors, pool, beam_width, tie_break, rng, frontier, budget,
+            blocked, vector)
+        if budget is not None:
+            budget.spend()
+        if recorder is not None:
+            record_generation(recorder, before, started, successors, score,
+                              _successors)
         if not _successors:
             break
         successors = _successors
         num_greenhouses = len(successors[0])
+        cheapest[num_greenhouses] = successors[0]
         best_solution.store(successors[0],
                             score,
                             field.maximum_greenhouses)
-    return [best_solution.solution()]
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(search_state(successors, best_solution, rng,
+                                         budget))
+    if curve is not None:
+        for count, found in cheapest.items():
+            if count <= field.maximum_greenhouses:
+                curve[count] = found.houses()
+    solution = best_solution.solution()
+    if solution is None:
+        # every merge left would swallow a third greenhouse before the
+        # partition got small enough.  collapse the smallest partition
+        # reached, unless the budget is spent; one greenhouse over all the
+        # berries is always a valid covering
+        fewest = cheapest[min(cheapest)].houses()
+        if budget is None or not budget.stopped:
+            fewest = collapse(fewest, field.maximum_greenhouses,
+                              field.feasible_region)
+            if get_score(fewest) < field.root_region[COST]:
+                return [fewest]
+        return [[field.root_region]]
+    return [solution.houses()]
+
+
+def search_state(successors, best_solution, rng, budget):
+    """ return what a checkpoint keeps of a search, as plain values: the
+    partitions to expand next, the best covering so far, the generations
+    spent in all its runs and the state of the random source """
+    best = best_solution.solution()
+    return {"successors": [[list(rect[:4]) for rect in found.houses()]
+                           for found in successors],
+            "best": (None if best is None else
+                     [list(rect[:4]) for rect in best.houses()]),
+            "generations": (budget.resumed + budget.spent
+                            if budget is not None else None),
+            "random": rng.getstate()}
+
+
+def resume_search(state, best_solution, rng, budget, maximum_greenhouses):
+    """ restore a search from a checkpoint's state; store its best
+    covering, put back the random state, note the generations spent, and
+    return the partitions to expand next.  the generations count towards
+    the stats, not the budget """
+    if state["best"] is not None:
+        best = Partition([make_rectangle(*corners)
+                          for corners in state["best"]])
+        best_solution.store(best, best.score, maximum_greenhouses)
+    if budget is not None and state["generations"] is not None:
+        budget.resumed = state["generations"]
+        recorder = current()
+        if recorder is not None:
+            recorder.count("resumed_generations", budget.resumed)
+    version, internal, gauss = state["random"]
+    rng.setstate((version, tuple(internal), gauss))
+    return [Partition([make_rectangle(*corners) for corners in houses])
+            for houses in state["successors"]]
+
+
+def lower_bound(partition, goal):
+    """ return the least score of any partition merged from this one.  a
+    merge never covers less area than the two greenhouses it replaces, and
+    saves one greenhouse's fixed cost; the search merges down to goal
+    greenhouses at most """
+    return partition.score - GREENHOUSE_COST * (len(partition) - goal)
+
+
+def record_generation(recorder, before, started, partitions, score,
+                      successors):
+    """ record one generation: its size, its best score, its time and what
+    the expansion counters grew by """
+    values = dict((name, count - before.get(name, 0))
+                  for name, count in recorder.counters.items()
+                  if name in EXPANSION_COUNTERS)
+    values.update(partitions=len(partitions),
+                  greenhouses=len(partitions[0]),
+                  kept=len(successors),
+                  best_score=score if successors else None,
+                  seconds=round(time.time() - started, 6))
+    recorder.generation(**values)
 
 
 @Memoize
@@ -138,128 +504,195 @@ def merge_rectangles(rect1, rect2):
     return rect1.merge(rect2)
 
 
-def successors_by_agglomeration(partitions):
-    """ main action is here """
-
-    # start out with max best score
-    best_score = sys.maxsize
-    # this is a set to eliminate duplicates
-    successors = set()
+def successors_by_agglomeration(partitions, pool=None, width=BEAM_WIDTH,
+                                tie_break="random", rng=random,
+                                frontier="ties", budget=None, blocked=None,
+                                vector=False):
+    """ main action is here.  return the best score and the successors of
+    the partitions kept by the beam, best first.  with a pool, the
+    partitions are expanded in parallel and their beams merged afterwards.
+    if the budget runs out part way, the successors found so far are
+    returned.  pairs in blocked, a BlockedPairs, are skipped and newly
+    blocked pairs added to it; the pool's workers do without.  vector
+    lets large partitions be expanded with numpy """
+    if pool is not None:
+        return parallel_successors(partitions, pool, width, tie_break,
+                                   frontier, rng)
+
+    # the beam eliminates duplicates and keeps the best successors
+    beam = Beam(width, tie_break, rng, frontier)
+    expanded = 0
 
     # for each possible solution
-    for greenhouse_list in partitions:
+    for partition in partitions:
 
         # check and see if we've generated enough successors
-        if len(successors) >= MAX_SUCCESSORS:
+        if beam.full():
             break
 
-        # baseline our progress
-        base_score = get_score(greenhouse_list)
-
-        # check each pair in the list
-        for house1, house2 in pairs(greenhouse_list):
+        # or run out of time
+        if budget is not None and budget.exhausted():
+            break
 
-            # make a copy
-            successor = greenhouse_list[:]
+        if vector and len(partition) >= VECTOR_MIN_HOUSES:
+            expand_partition_vectorized(partition, beam, rng)
+        else:
+            expand_partition(partition, beam, rng, blocked)
+        expanded += 1
+
+    recorder = current()
+    if recorder is not None:
+        recorder.count("expanded", expanded)
+
+    return beam.best_score(), beam.partitions()
+
+
+def expand_partition(partition, beam, rng=random, blocked=None):
+    """ try every merge of two greenhouses in one partition, offering each
+    valid successor to the beam.  pairs in blocked are not tried """
+
+    # baseline our progress
+    greenhouse_list = partition.houses()
+    base_score = partition.score
+    index = GridIndex(greenhouse_list)
+    tried = known = overlapping = pruned = offered = 0
+
+    # check each pair in the list
+    for house1, house2 in pairs(greenhouse_list, rng):
+        tried += 1
+
+        # skip pairs a strawberry keeps apart in every partition
+        if blocked is not None and (house1, house2) in blocked:
+            known += 1
+            continue
+
+        # merge the two
+        new_house = merge_rectangles(house1, house2)
+
+        # check and see if we included any other greenhouses
+        # if we did, we'll try another route - we want local, incremental
+        # aggregation
+        if index.count_overlaps(new_house, 2) != 2:
+            overlapping += 1
+            if blocked is not None:
+                blocked.check(house1, house2, new_house)
+            continue
+
+        # successor is valid
+        score = (base_score - house1[COST] -
+                 house2[COST] + new_house[COST])
+        # skip the successor if the beam is full of better ones
+        if score > beam.threshold():
+            pruned += 1
+            continue
+        beam.offer(partition.merge(greenhouse_list, house1, house2,
+                                   new_house), new_house)
+        offered += 1
+        # break if we're done
+        if beam.full():
+            break
 
-            # merge the two
+    recorder = current()
+    if recorder is not None:
+        recorder.count("pairs", tried)
+        recorder.count("blocked", known)
+        recorder.count("overlapping", overlapping)
+        recorder.count("pruned", pruned)
+        recorder.count("offered", offered)
+    return beam
+
+
+def expand_partition_vectorized(partition, beam, rng=random):
+    """ expand_partition with the pairs evaluated in blocks by numpy.  the
+    pairs come in the same order and draw the same random numbers, so the
+    beam ends up the same """
+    greenhouse_list = partition.houses()
+    rng.shuffle(greenhouse_list)
+    base_score = partition.score
+    table = arrays.MergeTable(greenhouse_list)
+    tried = overlapping = pruned = offered = 0
+
+    for first, stop in table.blocks():
+        # the threshold only falls, so pairs above it now stay out
+        count, blocked, firsts, seconds, deltas = table.evaluate(
+            first, stop, beam.threshold() - base_score)
+        tried += count
+        overlapping += blocked
+        pruned += count - blocked - len(firsts)
+        for idx1, idx2, delta in zip(firsts, seconds, deltas):
+            if base_score + delta > beam.threshold():
+                pruned += 1
+                continue
+            house1 = greenhouse_list[idx1]
+            house2 = greenhouse_list[idx2]
             new_house = merge_rectangles(house1, house2)
+            beam.offer(partition.merge(greenhouse_list, house1, house2,
+                                       new_house), new_house)
+            offered += 1
+            if beam.full():
+                break
+        if beam.full():
+            break
 
-            # check and see if we included any other greenhouses
-            # if we did, we'll try another route - we want local, incremental
-            # aggregation
-            count_overlaps = 0
-            for greenhouse in greenhouse_list:
-                if (greenhouse[B] < new_house[T] or
-                        greenhouse[T] > new_house[B] or
-                        greenhouse[R] < new_house[L] or
-                        greenhouse[L] > new_house[R]):
-                    continue
-                count_overlaps += 1
-                if count_overlaps > 2:
-                    break
-
-            if count_overlaps == 2:
-                # successor is valid
-                successor.remove(house1)
-                successor.remove(house2)
-                successor.append(new_house)
-                score = (base_score - house1[COST] -
-                         house2[COST] + new_house[COST])
-                # if we've improved, store it
-                if score < best_score:
-                    frozen_successor = frozenset(successor)
-                    successors = set()
-                    successors.add(frozen_successor)
-                    best_score = score
-                elif score == best_score:
-                    frozen_successor = frozenset(successor)
-                    successors.add(frozen_successor)
-                    # break if we're done
-                    if len(successors) >= MAX_SUCCESSORS:
-                        break
-
-    # convert our set to a mutable type
-    result = [[r for r in s] for s in successors]
-    # if we have too many, sample
-    if len(result) > MAX_SUCCESSORS:
-        return best_score, random.sample(result, MAX_SUCCESSORS)
-    # return the best score and the successors
-    return best_score, result
+    recorder = current()
+    if recorder is not None:
+        recorder.count("pairs", tried)
+        recorder.count("overlapping", overlapping)
+        recorder.count("pruned", pruned)
+        recorder.count("offered", offered)
+    return beam
+
+
+def expand_task(width, tie_break, frontier, task):
+    """ expand one partition into its own beam and return the beam's
+    items; a pool task.  task is the partition and the seed of the random
+    source it draws from, or None to draw from the worker's own """
+    partition, seed = task
+    rng = random if seed is None else random.Random(seed)
+    beam = Beam(width, tie_break, rng, frontier)
+    return expand_partition(partition, beam, rng).heap
+
+
+def parallel_successors(partitions, pool, width, tie_break, frontier,
+                        rng=random):
+    """ expand every partition through the pool, then merge the beams.
+    a seeded rng gives each partition a seed of its own, drawn in order, so
+    the result does not depend on which worker expands it.  the workers'
+    expansion counters are not recorded """
+    if rng is random:
+        seeds = [None] * len(partitions)
+    else:
+        seeds = [rng.getrandbits(64) for _ in partitions]
+    beam = Beam(width, tie_break, rng, frontier)
+    for found in pool.map(partial(expand_task, width, tie_break, frontier),
+                          zip(partitions, seeds)):
+        beam.merge(found)
+    return beam.best_score(), beam.partitions()
+
+
+def reseed():
+    """ pool initializer: forked workers would otherwise share the parent's
+    random state and shuffle their pairs identically """
+    random.seed()
 
 
 def get_horizontal_runs(field):
     """ return natural horizontal clusters """
-    berries = field.get_berries_in_rectangle(field.root_region)
-    for row in range(field.num_rows):
-        buf = []
-        for col in range(field.num_cols):
-            point = (row, col)
-            if point in berries:
-                buf.append(point)
-            else:
-                if buf:
-                    if len(buf) > 1:
-                        yield buf
-                    buf = []
-        if len(buf) > 1:
-            yield buf
+    for row, start, length in field.horizontal_runs():
+        yield [(row, col) for col in range(start, start + length)]
 
 
 def get_vertical_runs(field):
     """ return natural vertical clusters """
-    berries = field.get_berries_in_rectangle(field.root_region)
-    for col in range(field.num_cols):
-        buf = []
-        for row in range(field.num_rows):
-            point = (row, col)
-            if point in berries:
-                buf.append(point)
-            else:
-                if buf:
-                    if len(buf) > 1:
-                        yield buf
-                    buf = []
-        if len(buf) > 1:
-            yield buf
+    for col, start, length in field.vertical_runs():
+        yield [(row, col) for row in range(start, start + length)]
 
 
 def assign_open_greenhouses(field, partition):
     """ assign any open greenhouses sequentially """
-    # greenhouse_list = field.greenhouses(partition)
-    berries = field.get_berries_in_rectangle(field.root_region)
-    sp = sorted(partition, key=lambda x: x[AREA])
-    for berry in berries:
-        is_assigned = False
-        for r in sp:
-            if berry in r:
-                is_assigned = True
-                break
-        if not is_assigned:
-            # if any([berry in r for r in partition]): # greenhouse_list]):
-            #     continue
-            partition.append(
-                make_rectangle(berry[0], berry[1], berry[0], berry[1]))
+    for berry in field.uncovered_berries(partition):
+        partition.append(
+            make_rectangle(berry[0], berry[1], berry[0], berry[1]))
     return partition
 
 
@@ -271,32 +704,39 @@ def pointlist2rectangle(point_list):
                           max(row_elems), max(col_elems))
 
 
-def combine_and_maintain_density(field, partition):
-    """ for the start state, find natural greenhouses """
+def combine_and_maintain_density(field, partition, rng=random, budget=None):
+    """ for the start state, find natural greenhouses.  a budget, if given,
+    stops the passes once it runs out; the partition is a covering after
+    every merge, so it is returned as it stands """
     pcopy = partition[:]
-    fns = field.num_strawberries
+    full = field.is_full
+    index = GridIndex(partition)
+    recorder = current()
     while True:
         num_merged = 0
-        for first, second in pairs(pcopy):
-            if first not in partition:
+        if recorder is not None:
+            recorder.count("combine_passes")
+            recorder.count("combine_pairs",
+                           len(pcopy) * (len(pcopy) - 1) // 2)
+        for first, second in pairs(pcopy, rng):
+            if budget is not None and budget.exhausted():
+                return partition
+            if first not in index:
                 continue
-            if second not in partition:
+            if second not in index:
                 continue
             merged = merge_rectangles(first, second)
-            if fns(merged) == merged[AREA]:
-                count_overlaps = 0
-                for t in partition:
-                    if (t[B] < merged[T] or t[T] > merged[B] or
-                            t[R] < merged[L] or t[L] > merged[R]):
-                        continue
-                    count_overlaps += 1
-                    if count_overlaps > 2:
-                        break
-                if count_overlaps == 2:
+            if full(merged):
+                if index.count_overlaps(merged, 2) == 2:
                     partition.remove(first)
                     partition.remove(second)
                     partition.append(merged)
+                    index.remove(first)
+                    index.remove(second)
+                    index.add(merged)
                     num_merged += 1
+        if recorder is not None:
+            recorder.count("combine_merges", num_merged)
         if num_merged == 0:
             break
         pcopy = partition[:]
@@ -308,20 +748,29 @@ def get_score(partition):
     return sum([r[COST] for r in partition])
 
 
-def get_start_state(field):
+def get_start_state(field, rng=random, budget=None):
     """ get the starting state of the problem - a heuristic to reduce
-    the state space """
+    the state space.  large fields use numpy if it is installed; the
+    greenhouses are the same either way, and in the same order.  a budget,
+    if given, cuts the combining short """
+    if (arrays.available() and not field.sparse and
+            field.num_rows * field.num_cols >= VECTOR_MIN_CELLS):
+        return get_start_state_vectorized(field, rng, budget)
     mix = {}
     mirror = {}
     state = []
 
     vertical_runs = [pointlist2rectangle(v) for v in get_vertical_runs(field)]
     vertical_runs = assign_open_greenhouses(field, vertical_runs)
-    vertical_runs = combine_and_maintain_density(field, vertical_runs)
+    with timed("combine"):
+        vertical_runs = combine_and_maintain_density(field, vertical_runs,
+                                                     rng, budget)
 
     horiz_runs = [pointlist2rectangle(h) for h in get_horizontal_runs(field)]
     horiz_runs = assign_open_greenhouses(field, horiz_runs)
-    horiz_runs = combine_and_maintain_density(field, horiz_runs)
+    with timed("combine"):
+        horiz_runs = combine_and_maintain_density(field, horiz_runs, rng,
+                                                  budget)
 
     for berry, idx in field.list_berries(horiz_runs):
         mix[berry] = [idx]
@@ -333,7 +782,575 @@ def get_start_state(field):
     for key in mirror:
         state.append(pointlist2rectangle(mirror[key]))
 
-    return state
+    return sorted(state)
+
+
+def get_start_state_vectorized(field, rng=random, budget=None):
+    """ get_start_state with the runs, open berries and grouping done on
+    a numpy array """
+    grid = arrays.field_array(field)
+
+    vertical_runs = arrays.vertical_start(grid)
+    with timed("combine"):
+        vertical_runs = combine_and_maintain_density(field, vertical_runs,
+                                                     rng, budget)
+
+    horiz_runs = arrays.horizontal_start(grid)
+    with timed("combine"):
+        horiz_runs = combine_and_maintain_density(field, horiz_runs, rng,
+                                                  budget)
+
+    return sorted(arrays.group_berries(grid, horiz_runs, vertical_runs))
+
+
+def check_problem(field):
+    """ return warnings for a field outside the limits of the puzzle.  a
+    sparse field may be any size """
+    messages = []
+    if field.num_rows > 50 and not field.sparse:
+        messages.append("number of rows exceeds maximum of 50, skipping...")
+
+    if field.num_cols > 50 and not field.sparse:
+        messages.append(
+            "number of columns exceeds maximum of 50, skipping...")
+
+    if field.maximum_greenhouses > 10:
+        messages.append(
+            "number of greenhouses too large, need an integer N such")
+        messages.append("that 1 <= N <= 10...")
+
+    if field.maximum_greenhouses < 1:
+        messages.append(
+            "number of greenhouses too small, need an integer N such")
+        messages.append("that 1 <= N <= 10...")
+    return messages
+
+
+class Settings(object):
+    """ the knobs of one solve.  it is pickled along with each problem sent
+    to a worker process, so it holds plain values only """
+
+    def __init__(self, solver="heuristic", seconds=None,
+                 beam_width=BEAM_WIDTH, frontier="ties", tie_break="random",
+                 seed=None, stats=False, profile=None, sparse=False,
+                 deadline=None, generations=None, store=None,
+                 store_size=DEFAULT_MAX_ENTRIES, decompose=False,
+                 checkpoint=None, checkpoint_seconds=DEFAULT_SECONDS,
+                 resume=False, portfolio=1, portfolio_beams=None):
+        """ collect the settings; seed None draws from the global random
+        state, as the program always has.  stats records counters and timers
+        for each problem; profile is the index of a problem to run under
+        cProfile; sparse stores each field as its strawberries alone.
+        deadline, in seconds, and generations bound each search.  store is
+        the path of a solution store holding at most store_size solutions.
+        decompose solves separate groups of strawberries on their own.
+        checkpoint is a directory where each search is saved every
+        checkpoint_seconds; resume carries on from the searches saved
+        there.  portfolio runs that many searches of each problem and keeps
+        the cheapest, with beam widths taken in turn from portfolio_beams
+        if given """
+        self.solver = solver
+        self.seconds = seconds
+        self.beam_width = beam_width
+        self.frontier = frontier
+        self.tie_break = tie_break
+        self.seed = seed
+        self.stats = stats
+        self.profile = profile
+        self.sparse = sparse
+        self.deadline = deadline
+        self.generations = generations
+        self.store = store
+        self.store_size = store_size
+        self.decompose = decompose
+        self.checkpoint = checkpoint
+        self.checkpoint_seconds = checkpoint_seconds
+        self.resume = resume
+        self.portfolio = portfolio
+        self.portfolio_beams = portfolio_beams
+
+    def fingerprint(self):
+        """ return the settings that decide which covering is found, as a
+        string.  budgets are left out: only complete searches are stored """
+        return json.dumps({"version": STORE_VERSION,
+                           "solver": self.solver,
+                           "seconds": (self.seconds
+                                       if self.solver == "exact" else None),
+                           "beam_width": self.beam_width,
+                           "frontier": self.frontier,
+                           "tie_break": self.tie_break,
+                           "seed": self.seed,
+                           "decompose": self.decompose}, sort_keys=True)
+
+    def rng(self, data):
+        """ return the random source for a problem.  a seeded run derives a
+        separate stream from the seed and the problem text, so results do not
+        depend on the order or the process problems are solved in """
+        if self.seed is None:
+            return random
+        digest = md5("%s\n%s" % (self.seed, problem_text(data))).hexdigest()
+        return random.Random(int(digest, 16))
+
+
+def problem_text(data):
+    """ return the text of a problem, for hashing """
+    if isinstance(data, SparseProblem):
+        return data.key()
+    return "\n".join(data)
+
+
+def load_field(data, settings):
+    """ return the field of a problem, sparse if settings or the problem
+    ask for it """
+    if settings.sparse or isinstance(data, SparseProblem):
+        return SparseField(data)
+    return StrawberryField(data)
+
+
+def solve(data, settings=None, pool=None, cancel=None):
+    """ solve one problem; return the field, its best partition and
+    whether the search ran to completion.  the exact solver stops after
+    settings.seconds, if given, with its best covering so far.  either
+    solver stops at settings.deadline, after settings.generations
+    generations of the heuristic, or once cancel is set, and returns its
+    best covering so far as incomplete.  without a cancel flag, CANCEL is
+    cleared and used.  with settings.store set, a stored solution of the
+    same field, or of a translated, turned or mirrored copy, is returned
+    without searching, and complete solutions are stored """
+    if settings is None:
+        settings = Settings()
+    if cancel is None:
+        cancel = CANCEL
+        cancel.clear()
+    field = load_field(data, settings)
+    with problem_scope():
+        store = key = None
+        if settings.store is not None:
+            store = open_store(settings.store, settings.store_size)
+            key = field_key(field)
+        if key is not None:
+            solution = store.get(key, settings.fingerprint())
+            recorder = current()
+            if recorder is not None:
+                recorder.count("store_hits" if solution is not None
+                               else "store_misses")
+            if solution is not None:
+                return field, solution, True
+        if settings.solver == "exact":
+            with timed("exact"):
+                solution, complete = solve_exact(field, settings.seconds,
+                                                 cancel, settings.deadline)
+        else:
+            budget = Budget(settings.deadline, settings.generations, cancel)
+            solution = None
+            if settings.decompose:
+                with timed("components"):
+                    solution = solve_components(field, settings, pool,
+                                                budget)
+            checkpoint = None
+            if solution is None:
+                rng = settings.rng(data)
+                if settings.checkpoint is not None:
+                    checkpoint = Checkpoint(
+                        checkpoint_path(settings.checkpoint,
+                                        problem_text(data),
+                                        settings.fingerprint()),
+                        settings.checkpoint_seconds, settings.resume)
+                start_state = None
+                if checkpoint is None or checkpoint.state is None:
+                    with timed("start_state"):
+                        start_state = get_start_state(field, rng, budget)
+                with timed("agglomerate"):
+                    solution = agglomerate(field, start_state, 2, pool,
+                                           settings.beam_width,
+                                           settings.tie_break, rng,
+                                           settings.frontier, budget, None,
+                                           checkpoint)[0]
+            complete = not budget.stopped
+            if checkpoint is not None and complete:
+                checkpoint.remove()
+        if key is not None and complete:
+            store.put(key, settings.fingerprint(), field.greenhouses(solution))
+    return field, solution, complete
+
+
+def resolve(field, solution, added=(), removed=(), settings=None,
+            margin=1, cancel=None):
+    """ cover a field again after a few strawberries were added or removed.
+    the field is updated in place and its cached counts kept where still
+    valid.  greenhouses of the previous solution holding a changed point
+    are affected, and so are those within margin cells of an affected
+    greenhouse or a changed point.  the rest are kept whole; the
+    strawberries they leave uncovered get a start state of their own, and
+    the agglomeration runs over both.  return the new solution and whether
+    the search ran to completion.
+
+    the field's caches are not emptied afterwards, so a run of updates can
+    keep reusing them """
+    if settings is None:
+        settings = Settings()
+    if cancel is None:
+        cancel = CANCEL
+        cancel.clear()
+    changed = field.update(added, removed)
+    solution = [rect for rect in solution if rect]
+    if not changed:
+        return solution, True
+    touched = [make_rectangle(row, col, row, col) for row, col in changed]
+    affected = [rect for rect in solution
+                if near_any(rect, touched, 0)]
+    near = affected + touched
+    kept = [rect for rect in solution
+            if not near_any(rect, near, margin)]
+    loose = field.uncovered_berries(kept)
+    # a seeded run draws from the strawberries left to cover
+    rng = settings.rng(["%d %d" % point for point in loose])
+    budget = Budget(settings.deadline, settings.generations, cancel)
+    partition = kept + local_start_state(field, loose, rng, budget)
+    solution = agglomerate(field, partition, 2, None, settings.beam_width,
+                           settings.tie_break, rng, settings.frontier,
+                           budget)[0]
+    return field.greenhouses(solution), not budget.stopped
+
+
+def near_any(rect, boxes, margin):
+    """ return true if rect comes within margin cells of any of the boxes """
+    for box in boxes:
+        if (rect[B] + margin >= box[T] and rect[T] - margin <= box[B] and
+                rect[R] + margin >= box[L] and rect[L] - margin <= box[R]):
+            return True
+    return False
+
+
+def solve_components(field, settings, pool=None, budget=None):
+    """ solve each group of the field's strawberries on a field of its own,
+    then take the coverings, one per group, of least total cost within the
+    field's limit on greenhouses.  return the covering, or None if the
+    strawberries form one group or more groups than greenhouses allowed.
+    a sparse field with more groups than that collapses the groups' boxes
+    instead.  with a pool the groups are solved in parallel, each with the
+    time left and the generation limit to itself; otherwise they share the
+    budget """
+    groups = berry_groups(field.get_berries_in_rectangle(field.root_region))
+    limit = field.maximum_greenhouses
+    if len(groups) > limit and field.sparse:
+        recorder = current()
+        if recorder is not None:
+            recorder.count("components", len(groups))
+        return collapse([pointlist2rectangle(berries) for berries in groups],
+                        limit, field.feasible_region)
+    if len(groups) < 2 or len(groups) > limit:
+        return None
+    recorder = current()
+    if recorder is not None:
+        recorder.count("components", len(groups))
+    # each group leaves at least one greenhouse to every other
+    crops = [local_problem(field, berries, limit - len(groups) + 1)
+             for berries in groups]
+    if pool is not None:
+        seconds = generations = None
+        if budget is not None:
+            generations = budget.generations
+            if budget.deadline is not None:
+                seconds = max(0, budget.deadline - time.time())
+        found = pool.map(partial(component_curve, settings=settings,
+                                 seconds=seconds, generations=generations),
+                         [data for data, _, _ in crops])
+        if budget is not None and any([stopped for _, stopped in found]):
+            budget.stopped = True
+    else:
+        found = [component_curve(data, settings, budget=budget)
+                 for data, _, _ in crops]
+    curves = []
+    for (_, top, left), (curve, _) in zip(crops, found):
+        curves.append(dict((count, place(rects, top, left))
+                           for count, rects in curve.items()))
+    counts = cheapest_combination(
+        [dict((count, get_score(rects)) for count, rects in curve.items())
+         for curve in curves], limit)
+    solution = []
+    for curve, count in zip(curves, counts):
+        solution.extend(curve[count])
+    return solution
+
+
+def component_curve(data, settings, seconds=None, generations=None,
+                    budget=None):
+    """ solve a cropped field and return the corners of the cheapest
+    covering found with each number of greenhouses, by number, and whether
+    the search was cut short.  a budget, if not given, is made from seconds
+    and generations.  this lives at module level so a process pool can run
+    it """
+    if budget is None:
+        budget = Budget(seconds, generations)
+    if isinstance(data, SparseProblem):
+        field = SparseField(data)
+    else:
+        field = StrawberryField(data)
+    rng = settings.rng(data)
+    curve = {}
+    agglomerate(field, get_start_state(field, rng, budget), 2, None,
+                settings.beam_width, settings.tie_break, rng,
+                settings.frontier, budget, curve)
+    # one greenhouse over all the berries is always a covering
+    if 1 not in curve or get_score(curve[1]) > field.root_region[COST]:
+        curve[1] = [field.root_region]
+    return (dict((count, [tuple(rect[:4]) for rect in rects])
+                 for count, rects in curve.items()), budget.stopped)
+
+
+def local_problem(field, berries, maximum_greenhouses):
+    """ return the problem data of a field holding some of a field's
+    strawberries alone, cropped to them, and the row and column of the
+    field its top left corner lies on """
+    top = min([row for row, _ in berries])
+    left = min([col for _, col in berries])
+    height = max([row for row, _ in berries]) - top + 1
+    width = max([col for _, col in berries]) - left + 1
+    if field.sparse:
+        ordered = sorted(berries)
+        data = SparseProblem(
+            maximum_greenhouses, height, width,
+            array("l", [row - top for row, _ in ordered]),
+            array("l", [col - left for _, col in ordered]))
+    else:
+        grid = [["."] * width for _ in xrange(height)]
+        for row, col in berries:
+            grid[row - top][col - left] = "@"
+        data = ([str(maximum_greenhouses)] +
+                ["".join(line) for line in grid])
+    return data, top, left
+
+
+def local_start_state(field, berries, rng=random, budget=None):
+    """ return a start state for some of a field's strawberries: the start
+    state of a field holding them alone, cropped to them, placed back on
+    the field.  each of its greenhouses lies within a rectangle full of
+    those strawberries, so it cannot overlap a greenhouse covering others """
+    if not berries:
+        return []
+    data, top, left = local_problem(field, berries,
+                                    field.maximum_greenhouses)
+    if field.sparse:
+        local = SparseField(data)
+    else:
+        local = StrawberryField(data)
+    return place(get_start_state(local, rng, budget), top, left)
+
+
+def cost_floor(field):
+    """ return a cost no covering of the field can beat: one greenhouse
+    costs at least its bounding box, and more than one cost 10 apiece plus
+    a cell per strawberry """
+    root = field.root_region
+    if root[B] < root[T]:
+        return 0
+    floor = root[COST]
+    if field.maximum_greenhouses > 1:
+        floor = min(floor, field.num_strawberries(root) +
+                    2 * GREENHOUSE_COST)
+    return floor
+
+
+def portfolio_members(settings):
+    """ return the settings of each search of a portfolio.  the first
+    keeps the seed; the others derive theirs from it, or draw from their
+    own process's random state in an unseeded run.  beam widths are taken
+    from settings.portfolio_beams in turn """
+    members = []
+    for idx in range(settings.portfolio):
+        member = copy(settings)
+        member.portfolio = 1
+        member.portfolio_beams = None
+        member.stats = False
+        member.profile = None
+        if settings.seed is not None and idx:
+            member.seed = "%s/%d" % (settings.seed, idx)
+        if settings.portfolio_beams:
+            member.beam_width = settings.portfolio_beams[
+                idx % len(settings.portfolio_beams)]
+        members.append(member)
+    return members
+
+
+# in a portfolio worker, the number of the last problem one of its searches
+# solved at its cost floor, shared by all the workers
+PORTFOLIO_FLOOR = None
+PORTFOLIO_RUNS = count(1)
+
+
+class PortfolioCancel(object):
+    """ stops a portfolio search once another search of the same problem
+    reaches the cost floor, or on SIGUSR1 """
+
+    def __init__(self, run):
+        """ watch for the problem numbered run """
+        self.run = run
+
+    def is_set(self):
+        """ return true if the search should stop """
+        return CANCEL.is_set() or PORTFOLIO_FLOOR.value == self.run
+
+
+def portfolio_worker(floor):
+    """ pool initializer for portfolio searches: reseed, and keep the
+    shared value through which searches stop each other """
+    global PORTFOLIO_FLOOR
+    reseed()
+    PORTFOLIO_FLOOR = floor
+
+
+def portfolio_search(data, floor, run, member):
+    """ one search of a portfolio, in a worker; return its covering and
+    whether it ran to completion.  a search that reaches floor stops the
+    others of the same run """
+    CANCEL.clear()
+    _, solution, complete = solve(data, member, None, PortfolioCancel(run))
+    if get_score(solution) <= floor:
+        PORTFOLIO_FLOOR.value = run
+    return solution, complete
+
+
+def solve_portfolio(data, settings, pool=None):
+    """ solve a problem with settings.portfolio separate searches, as
+    portfolio_members sets them up, and return the cheapest covering as
+    solve does.  the pool, started with portfolio_worker, runs them at
+    once; without one they run in turn.  either way, once a search reaches
+    the cost floor the rest are stopped or skipped.  searches share only
+    the problem, and the cheapest covering, the first on ties, is kept """
+    field = load_field(data, settings)
+    floor = cost_floor(field)
+    members = portfolio_members(settings)
+    if pool is None:
+        found = []
+        for member in members:
+            found.append(solve(data, member)[1:])
+            if get_score(found[-1][0]) <= floor:
+                break
+    else:
+        found = pool.map(partial(portfolio_search, data, floor,
+                                 next(PORTFOLIO_RUNS)), members)
+    recorder = current()
+    if recorder is not None:
+        recorder.count("portfolio_searches", len(found))
+    scores = [get_score(solution) for solution, _ in found]
+    solution, complete = found[scores.index(min(scores))]
+    return field, solution, complete or min(scores) <= floor
+
+
+def solve_problem(data, settings=None, pool=None, picture=True):
+    """ solve one problem and return a dict of its warnings, cost,
+    greenhouses, solve time and completeness, plus its picture unless
+    picture is false and its recorded stats if settings ask for them.
+    this lives at module level so a process pool can run it """
+    if settings is not None and settings.stats:
+        with recording() as recorder:
+            result = _solve_problem(data, settings, pool, picture)
+        result["stats"] = recorder.as_dict()
+        return result
+    return _solve_problem(data, settings, pool, picture)
+
+
+def _solve_problem(data, settings, pool, picture):
+    """ solve one problem and build its result """
+    started = time.time()
+    if settings is not None and settings.portfolio > 1:
+        field, solution, complete = solve_portfolio(data, settings, pool)
+    else:
+        field, solution, complete = solve(data, settings, pool)
+    messages = check_problem(field)
+    if not complete:
+        messages.append("search stopped early, the cost below is the best "
+                        "found and may not be optimal")
+    result = {"messages": messages,
+              "cost": get_score(solution),
+              "greenhouses": [list(rect[:4])
+                              for rect in field.greenhouses(solution)],
+              "seconds": round(time.time() - started, 6),
+              "complete": complete}
+    if picture:
+        with timed("display"):
+            result["picture"] = field.display(solution)
+    return result
+
+
+def solve_numbered(numbered, settings, pool=None, picture=True):
+    """ solve_problem for an (index, data) pair.  the problem whose index
+    is settings.profile runs under cProfile, its report going to standard
+    error """
+    index, data = numbered
+    if index == settings.profile:
+        with profiled():
+            return solve_problem(data, settings, pool, picture)
+    return solve_problem(data, settings, pool, picture)
+
+
+def cancel_current(signum, frame):
+    """ signal handler: cut short the problem this process is solving """
+    CANCEL.set()
+
+
+def bounded_imap(pool, func, iterable, window):
+    """ like pool.imap, but with at most window tasks outstanding.  the
+    pool's own feeder drains the whole iterable up front, which for a
+    long stream of problems means holding them all in memory.  the
+    iterable is read on a thread of its own, so each result is yielded as
+    soon as it and those before it are ready, even while the next item is
+    still awaited """
+    slots = threading.Semaphore(window)
+    pending = Queue()
+
+    def feed():
+        """ submit the items, waiting for a free slot before each """
+        try:
+            for item in iterable:
+                slots.acquire()
+                pending.put((pool.apply_async(func, (item,)), None))
+        except Exception:
+            pending.put((None, sys.exc_info()))
+        else:
+            pending.put((None, None))
+
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    while True:
+        result, error = pending.get()
+        if result is None:
+            if error is not None:
+                raise error[0], error[1], error[2]
+            return
+        value = result.get()
+        slots.release()
+        yield value
+
+
+def write_text(result, out=sys.stdout):
+    """ print a result the way the program always has.  recorded stats go
+    to standard error as a line of json """
+    for message in result["messages"]:
+        print >> out, message
+    print >> out, result["cost"]
+    print >> out, result["picture"]
+    if "stats" in result:
+        print >> sys.stderr, json.dumps(result["stats"], sort_keys=True)
+
+
+def write_jsonl(result, index, out=sys.stdout):
+    """ write a result as a single line of json and flush it, so a reader
+    on the other end of a pipe sees each problem as soon as it is solved """
+    record = {"problem": index,
+              "cost": result["cost"],
+              "greenhouses": result["greenhouses"],
+              "seconds": result["seconds"],
+              "complete": result["complete"]}
+    if result["messages"]:
+        record["messages"] = result["messages"]
+    if "stats" in result:
+        record["stats"] = result["stats"]
+    out.write(json.dumps(record, sort_keys=True))
+    out.write("\n")
+    out.flush()
 
 
 def main():
@@ -343,37 +1360,179 @@ def main():
     parser = OptionParser(usage)
     parser.add_option("-i", "--input", dest="infile",
                       default="../data/rectangles.txt",
-                      help="read data from FILENAME")
+                      help="read data from FILENAME, or - for standard "
+                      "input")
+    parser.add_option("-f", "--format", dest="format", default="text",
+                      type="choice", choices=["text", "jsonl"],
+                      help="print pictures and a total, or one json line "
+                      "per problem as it is solved [default: %default]")
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+                      default=1,
+                      help="solve problems in N processes [default: %default]")
+    parser.add_option("-e", "--expand-workers", dest="expand_workers",
+                      type="int", default=1,
+                      help="expand each generation of a single problem in N "
+                      "processes [default: %default]")
+    parser.add_option("-s", "--solver", dest="solver", default="heuristic",
+                      type="choice", choices=["heuristic", "exact"],
+                      help="heuristic agglomeration or exact search "
+                      "[default: %default]")
+    parser.add_option("--exact-seconds", dest="seconds", type="float",
+                      default=60.0,
+                      help="time limit per problem for the exact solver's "
+                      "general search [default: %default]")
+    parser.add_option("-b", "--beam-width", dest="beam_width", type="int",
+                      default=BEAM_WIDTH,
+                      help="successors kept per generation [default: "
+                      "%default]")
+    parser.add_option("--frontier", dest="frontier", default="ties",
+                      type="choice", choices=FRONTIERS,
+                      help="keep only successors tying the best score, or "
+                      "the best successors tied or not [default: %default]")
+    parser.add_option("--tie-break", dest="tie_break", default="random",
+                      type="choice", choices=TIE_BREAKS,
+                      help="rank successors with equal scores: %s "
+                      "[default: %%default]" % ", ".join(TIE_BREAKS))
+    parser.add_option("--seed", dest="seed", type="int", default=None,
+                      help="seed the search for reproducible results")
+    parser.add_option("--stats", dest="stats", action="store_true",
+                      default=False,
+                      help="record counters and timers for each problem")
+    parser.add_option("--profile", dest="profile", type="int", default=None,
+                      help="run problem N (counting from 0) under cProfile")
+    parser.add_option("--sparse", dest="sparse", action="store_true",
+                      default=False,
+                      help="store fields as their strawberries alone and "
+                      "memory map the input, for large fields with few "
+                      "strawberries; implies --decompose")
+    parser.add_option("--deadline-ms", dest="deadline_ms", type="float",
+                      default=None,
+                      help="stop each problem's search after N milliseconds "
+                      "and report the best covering so far")
+    parser.add_option("--max-generations", dest="generations", type="int",
+                      default=None,
+                      help="stop each heuristic search after N generations")
+    parser.add_option("--store", dest="store", default=None,
+                      help="reuse and keep solutions in the SQLite file "
+                      "FILENAME")
+    parser.add_option("--store-size", dest="store_size", type="int",
+                      default=DEFAULT_MAX_ENTRIES,
+                      help="solutions kept in the store, least recently "
+                      "used dropped first [default: %default]")
+    parser.add_option("--store-invalidate", dest="store_invalidate",
+                      action="store_true", default=False,
+                      help="drop stored solutions made with other settings")
+    parser.add_option("--decompose", dest="decompose", action="store_true",
+                      default=False,
+                      help="solve separate groups of strawberries on their "
+                      "own, in parallel with --expand-workers")
+    parser.add_option("--checkpoint", dest="checkpoint", default=None,
+                      help="save each search in the directory DIR as it "
+                      "goes")
+    parser.add_option("--checkpoint-seconds", dest="checkpoint_seconds",
+                      type="float", default=DEFAULT_SECONDS,
+                      help="save a search every N seconds [default: "
+                      "%default]")
+    parser.add_option("--resume", dest="resume", action="store_true",
+                      default=False,
+                      help="carry on from the searches saved with "
+                      "--checkpoint")
+    parser.add_option("--portfolio", dest="portfolio", type="int",
+                      default=1,
+                      help="run N differently seeded searches of each "
+                      "problem at once, in N processes, and keep the "
+                      "cheapest [default: %default]")
+    parser.add_option("--portfolio-beams", dest="portfolio_beams",
+                      default=None,
+                      help="beam widths of the --portfolio searches, comma "
+                      "separated and taken in turn, as in 50,100,200")
     (options, _) = parser.parse_args()
+    if options.workers > 1 and options.expand_workers > 1:
+        parser.error("--workers and --expand-workers are exclusive")
+    if options.sparse and options.solver == "exact":
+        parser.error("--sparse works with the heuristic solver only")
+    if options.beam_width < 1:
+        parser.error("--beam-width must be at least 1")
+    if options.resume and options.checkpoint is None:
+        parser.error("--resume needs --checkpoint")
+    if options.portfolio < 1:
+        parser.error("--portfolio must be at least 1")
+    if options.portfolio > 1 and (options.workers > 1 or
+                                  options.expand_workers > 1):
+        parser.error("--portfolio, --workers and --expand-workers are "
+                     "exclusive")
+    if options.portfolio > 1 and options.solver == "exact":
+        parser.error("--portfolio works with the heuristic solver only")
+    portfolio_beams = None
+    if options.portfolio_beams is not None:
+        try:
+            portfolio_beams = tuple([int(width) for width in
+                                     options.portfolio_beams.split(",")])
+        except ValueError:
+            parser.error("--portfolio-beams must be integers separated by "
+                         "commas")
+        if min(portfolio_beams) < 1:
+            parser.error("--portfolio-beams must be at least 1")
+    if options.checkpoint is not None and not os.path.isdir(
+            options.checkpoint):
+        os.makedirs(options.checkpoint)
+
+    deadline = None
+    if options.deadline_ms is not None:
+        deadline = options.deadline_ms / 1000.0
+    settings = Settings(options.solver, options.seconds, options.beam_width,
+                        options.frontier, options.tie_break, options.seed,
+                        options.stats, options.profile, options.sparse,
+                        deadline, options.generations, options.store,
+                        options.store_size,
+                        options.decompose or options.sparse,
+                        options.checkpoint, options.checkpoint_seconds,
+                        options.resume, options.portfolio, portfolio_beams)
+    if options.store is not None and options.store_invalidate:
+        store = SolutionStore(options.store)
+        store.invalidate(settings.fingerprint())
+        store.close()
+    # SIGUSR1 cuts short the problem being solved.  workers forked below
+    # inherit the handler, so each can be signalled on its own
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, cancel_current)
+    if options.sparse:
+        problems = enumerate(load_problems(options.infile))
+    else:
+        problems = enumerate(get_problems(options.infile))
+    task = partial(solve_numbered, settings=settings,
+                   picture=options.format == "text")
+    pool = None
+    if options.workers > 1:
+        # results come back in input order as soon as each is ready, with
+        # a few problems per worker read ahead to keep the pool busy
+        pool = Pool(options.workers)
+        results = bounded_imap(pool, task, problems, 4 * options.workers)
+    elif options.expand_workers > 1:
+        pool = Pool(options.expand_workers, reseed)
+        results = imap(partial(task, pool=pool), problems)
+    elif options.portfolio > 1:
+        # the searches of a problem stop each other through a value shared
+        # by the workers, set to the problem's run number by the first to
+        # reach the cost floor
+        pool = Pool(options.portfolio, portfolio_worker, (RawValue("l", 0),))
+        results = imap(partial(task, pool=pool), problems)
+    else:
+        results = imap(task, problems)
 
     total_cost = 0
-    for problem in get_problems(options.infile):
-        problem = StrawberryField(problem)
-
-        if problem.num_rows > 50:
-            print "number of rows exceeds maximum of 50, skipping..."
-
-        if problem.num_cols > 50:
-            print "number of columns exceeds maximum of 50, skipping..."
-
-        if problem.maximum_greenhouses > 10:
-            print "number of greenhouses too large, need an integer N such"
-            print "that 1 <= N <= 10..."
-
-        if problem.maximum_greenhouses < 1:
-            print "number of greenhouses too small, need an integer N such"
-            print "that 1 <= N <= 10..."
-
-        start_state = get_start_state(problem)
-        solutions = agglomerate(problem, start_state, 2)
-        cost = get_score(solutions[0])
-        print cost
-        print problem.display(solutions[0])
-        # print problem.maximum_greenhouses
-        # print problem
-        total_cost += cost
-    print
-    print "Total cost for all greenhouses:", total_cost
+    for index, result in enumerate(results):
+        if options.format == "jsonl":
+            write_jsonl(result, index)
+        else:
+            write_text(result)
+        total_cost += result["cost"]
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if options.format == "text":
+        print
+        print "Total cost for all greenhouses:", total_cost
     return 0
 
 if __name__ == "__main__":
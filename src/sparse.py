@@ -0,0 +1,404 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+A sparse mode for large fields holding few strawberries.
+
+StrawberryField keeps a summed-area table and a bitmask per row and column,
+which grow with the area of the field.  SparseField keeps only the
+strawberries, in coordinate sorted arrays: once in row major order, grouped
+by row, and once in column major order, grouped by column.  Counting the
+berries in a rectangle walks whichever of its rows or columns holds fewer
+lines of berries, so memory and every query grow with the number of
+strawberries rather than the area.
+
+Problems are read as SparseProblem tuples.  A file named by path is memory
+mapped and scanned for '@' in place, a row at a time, so no row is copied
+into a string; other input is read a line at a time.  Either way a problem
+is held as its strawberries alone.
+"""
+
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from field import LABELS, StrawberryField, paint_line, render
+from memoize import Memoize
+from rectangle import make_rectangle
+
+T, L, B, R, AREA = 0, 1, 2, 3, 5
+BLANKS = " \t\r"
+
+
+class SparseProblem(
+        namedtuple("SparseProblem",
+                   "maximum_greenhouses, num_rows, num_cols, rows, cols")):
+    """ a problem as its strawberries: rows and cols are parallel arrays of
+    their coordinates in row major order """
+    __slots__ = ()
+
+    def key(self):
+        """ return a string identifying the problem, for seeding """
+        return "%d %d %d\n%s\n%s" % (self.maximum_greenhouses, self.num_rows,
+                                     self.num_cols, self.rows.tostring(),
+                                     self.cols.tostring())
+
+
+class SparseBuilder(object):
+    """ collect the strawberries of a problem a row at a time """
+
+    def __init__(self, maximum_greenhouses):
+        """ start a problem with no rows """
+        self.maximum_greenhouses = maximum_greenhouses
+        self.num_rows = 0
+        self.num_cols = 0
+        self.rows = array("l")
+        self.cols = array("l")
+
+    def add(self, col):
+        """ add a strawberry at col of the current row """
+        self.rows.append(self.num_rows)
+        self.cols.append(col)
+
+    def end_row(self, width):
+        """ finish the current row, width cells wide """
+        if self.num_cols < width:
+            self.num_cols = width
+        self.num_rows += 1
+
+    def add_row(self, line):
+        """ add a row given as text """
+        col = line.find("@")
+        while col >= 0:
+            self.add(col)
+            col = line.find("@", col + 1)
+        self.end_row(len(line))
+
+    def problem(self):
+        """ return the problem built so far """
+        return SparseProblem(self.maximum_greenhouses, self.num_rows,
+                             self.num_cols, self.rows, self.cols)
+
+
+def sparse_problem(data):
+    """ convert the lines of a problem, as get_problems returns them """
+    builder = SparseBuilder(int(data[0]))
+    for line in data[1:]:
+        builder.add_row(line)
+    return builder.problem()
+
+
+def load_problems(infile="../data/rectangles.txt"):
+    """ yield the problems of a file as SparseProblems.  infile is a path,
+    which is memory mapped, "-" for standard input, or an open file """
+    if infile == "-":
+        return read_problems(sys.stdin)
+    if not isinstance(infile, basestring):
+        return read_problems(infile)
+    return map_problems(infile)
+
+
+def read_problems(fh):
+    """ yield the problems of an open file as they are read """
+    builder = None
+    for line in iter(fh.readline, ""):
+        line = line.strip()
+        if not line:
+            if builder is not None:
+                yield builder.problem()
+            builder = None
+        elif builder is None:
+            builder = SparseBuilder(int(line))
+        else:
+            builder.add_row(line)
+    if builder is not None:
+        yield builder.problem()
+
+
+def map_problems(path):
+    """ yield the problems of a file by memory mapping it.  lines are found
+    and searched for strawberries in the map, never copied """
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for problem in scan_problems(mapped):
+                yield problem
+        finally:
+            mapped.close()
+
+
+def scan_problems(mapped):
+    """ yield the problems in a buffer with find and slicing """
+    builder = None
+    pos, size = 0, len(mapped)
+    while pos < size:
+        end = mapped.find("\n", pos)
+        if end < 0:
+            end = size
+        start, stop = pos, end
+        while start < stop and mapped[start] in BLANKS:
+            start += 1
+        while stop > start and mapped[stop - 1] in BLANKS:
+            stop -= 1
+        if start == stop:
+            if builder is not None:
+                yield builder.problem()
+            builder = None
+        elif builder is None:
+            builder = SparseBuilder(int(mapped[start:stop]))
+        else:
+            col = mapped.find("@", start, stop)
+            while col >= 0:
+                builder.add(col - start)
+                col = mapped.find("@", col + 1, stop)
+            builder.end_row(stop - start)
+        pos = end + 1
+    if builder is not None:
+        yield builder.problem()
+
+
+class CompressedLines(object):
+    """ points sorted by line and then by position along the line.  lines
+    holds the occupied lines, positions the points' positions, and the
+    points of lines[i] are positions[starts[i]:starts[i + 1]] """
+
+    def __init__(self, lines, positions):
+        """ compress parallel arrays of sorted points """
+        self.lines = array("l")
+        self.starts = array("l")
+        self.positions = array("l", positions)
+        previous = None
+        for idx, line in enumerate(lines):
+            if line != previous:
+                self.lines.append(line)
+                self.starts.append(idx)
+                previous = line
+        self.starts.append(len(self.positions))
+
+    def span(self, low, high):
+        """ return the range of indices of the occupied lines from low to
+        high inclusive """
+        return (bisect_left(self.lines, low),
+                bisect_right(self.lines, high))
+
+    def count(self, first, last, low, high):
+        """ count the points between positions low and high on the lines
+        indexed first to last, exclusive """
+        positions, starts = self.positions, self.starts
+        total = 0
+        for idx in xrange(first, last):
+            start, end = starts[idx], starts[idx + 1]
+            total += (bisect_right(positions, high, start, end) -
+                      bisect_left(positions, low, start, end))
+        return total
+
+    def full(self, first, last, low, high):
+        """ return true if every position from low to high is taken on the
+        lines indexed first to last, exclusive """
+        positions, starts = self.positions, self.starts
+        width = high - low + 1
+        for idx in xrange(first, last):
+            start, end = starts[idx], starts[idx + 1]
+            if (bisect_right(positions, high, start, end) -
+                    bisect_left(positions, low, start, end)) != width:
+                return False
+        return True
+
+    def points(self, first, last, low, high):
+        """ generate (line, position) for the points between positions low
+        and high on the lines indexed first to last, exclusive """
+        lines, positions, starts = self.lines, self.positions, self.starts
+        for idx in xrange(first, last):
+            start, end = starts[idx], starts[idx + 1]
+            line = lines[idx]
+            for pos in positions[bisect_left(positions, low, start, end):
+                                 bisect_right(positions, high, start, end)]:
+                yield line, pos
+
+    def runs(self):
+        """ generate (line, start, length) for each run of two or more
+        consecutive positions, line by line """
+        lines, positions, starts = self.lines, self.positions, self.starts
+        for idx, line in enumerate(lines):
+            start, end = starts[idx], starts[idx + 1]
+            first = start
+            for cur in xrange(start + 1, end + 1):
+                if cur == end or positions[cur] != positions[cur - 1] + 1:
+                    if cur - first > 1:
+                        yield line, positions[first], cur - first
+                    first = cur
+
+
+class SparseField(StrawberryField):
+    """ a field stored as its strawberries alone.  by_row holds them grouped
+    by row, by_col grouped by column.  the solver's queries - counting,
+    listing, runs and coverage - scale with the number of strawberries and
+    rectangles, not with the area of the field """
+    sparse = True
+
+    def __init__(self, data):
+        """ create a field from a SparseProblem or from problem lines """
+        if not isinstance(data, SparseProblem):
+            data = sparse_problem(data)
+        self.maximum_greenhouses = data.maximum_greenhouses
+        self.num_rows = data.num_rows
+        self.num_cols = data.num_cols
+        self.build_index(data.rows, data.cols)
+
+    def build_index(self, rows, cols):
+        """ index the strawberries given by parallel arrays of coordinates
+        in row major order """
+        self.by_row = CompressedLines(rows, cols)
+        order = sorted(xrange(len(rows)), key=lambda i: (cols[i], rows[i]))
+        self.by_col = CompressedLines([cols[i] for i in order],
+                                      [rows[i] for i in order])
+        if len(rows):
+            self.top, self.bottom = self.by_row.lines[0], self.by_row.lines[-1]
+            self.left, self.right = self.by_col.lines[0], self.by_col.lines[-1]
+        else:
+            self.top = self.left = sys.maxsize
+            self.bottom = self.right = -1
+        self.root_region = \
+            make_rectangle(self.top, self.left, self.bottom, self.right)
+
+    def count(self, top, left, bottom, right):
+        """ return the count of strawberries in the given bounds (inclusive),
+        walking the rows or the columns, whichever holds fewer berries """
+        if top > bottom or left > right:
+            return 0
+        first_row, last_row = self.by_row.span(top, bottom)
+        first_col, last_col = self.by_col.span(left, right)
+        if last_row - first_row <= last_col - first_col:
+            return self.by_row.count(first_row, last_row, left, right)
+        return self.by_col.count(first_col, last_col, top, bottom)
+
+    def has_berry(self, point):
+        """ return true if there is a strawberry at the point """
+        row, col = point
+        return self.count(row, col, row, col) == 1
+
+    def update(self, added=(), removed=()):
+        """ add and remove strawberries in place; return the points that
+        changed.  the arrays are rebuilt from the strawberries, and cached
+        results for rectangles holding a changed point are dropped """
+        berries = set(self.berries())
+        changed = []
+        for points, present in ((added, True), (removed, False)):
+            for point in points:
+                row, col = point
+                if not (0 <= row < self.num_rows and 0 <= col < self.num_cols):
+                    raise ValueError("%r lies outside the field" % (point,))
+                if (point in berries) != present:
+                    berries.symmetric_difference_update([point])
+                    changed.append((row, col))
+        if changed:
+            ordered = sorted(berries)
+            self.build_index(array("l", [row for row, _ in ordered]),
+                             array("l", [col for _, col in ordered]))
+            self.forget(changed)
+        return changed
+
+    def is_full(self, rectangle):
+        """ return true if every cell of the rectangle holds a strawberry.
+        most rectangles of a sparse field have an empty row, found by two
+        bisections """
+        first, last = self.by_row.span(rectangle[T], rectangle[B])
+        if last - first != rectangle[B] - rectangle[T] + 1:
+            return False
+        return self.by_row.full(first, last, rectangle[L], rectangle[R])
+
+    def berries(self, rectangle=None):
+        """ generate the strawberries in the rectangle, or all of them, in
+        row major order """
+        if rectangle is None:
+            return self.by_row.points(0, len(self.by_row.lines),
+                                      -1, sys.maxsize)
+        first, last = self.by_row.span(rectangle[T], rectangle[B])
+        return self.by_row.points(first, last, rectangle[L], rectangle[R])
+
+    @Memoize
+    def get_berries_in_rectangle(self, rectangle):
+        """ get a list of strawberries in the rectangle """
+        return list(self.berries(rectangle))
+
+    def uncovered_berries(self, partition):
+        """ return the strawberries not covered by the partition, in row
+        major order """
+        covered = set()
+        for rect in partition:
+            covered.update(self.berries(rect))
+        return [berry for berry in self.berries() if berry not in covered]
+
+    def covers_all(self, partition):
+        """ return true if every strawberry lies in some rectangle """
+        return not self.uncovered_berries(partition)
+
+    def list_berries(self, partition):
+        """ helper to set up the start state: pair each berry with the id of
+        the first rectangle containing it, or None """
+        owner = {}
+        for idx, rect in enumerate(partition):
+            for berry in self.berries(rect):
+                owner.setdefault(berry, idx)
+        return [(berry, owner.get(berry)) for berry in self.berries()]
+
+    def horizontal_runs(self):
+        """ generate (row, start, length) for each run of two or more
+        strawberries along a row, row by row """
+        return self.by_row.runs()
+
+    def vertical_runs(self):
+        """ generate (col, start, length) for each run of two or more
+        strawberries down a column, column by column """
+        return self.by_col.runs()
+
+    def display(self, partition, out=None):
+        """ return a string representation of a field, as
+        StrawberryField.display.  rows are painted one at a time, so with a
+        file object only one row is held at once """
+        rects = [self.feasible_region(rect) for rect in partition]
+        return render(self.painted_rows(rects, "*", True), out)
+
+    def display_full(self, partition, out=None):
+        """ display full paritions, not just feasible regions """
+        return render(self.painted_rows(partition, None, False), out)
+
+    def painted_rows(self, partition, overlap, berries):
+        """ generate the rows of the picture, each a list of characters.
+        rectangles are swept from top to bottom, so each row is painted by
+        the rectangles crossing it alone """
+        waiting = sorted((rect[T], rect_id, rect)
+                         for rect_id, rect in enumerate(partition) if rect)
+        waiting.reverse()
+        active = []
+        lines = self.by_row.lines
+        next_line = 0
+        for row in xrange(self.num_rows):
+            line = ["."] * self.num_cols
+            if (berries and next_line < len(lines) and
+                    lines[next_line] == row):
+                for _, col in self.by_row.points(next_line, next_line + 1,
+                                                 -1, sys.maxsize):
+                    line[col] = "@"
+                next_line += 1
+            added = False
+            while waiting and waiting[-1][0] == row:
+                active.append(waiting.pop()[1:])
+                added = True
+            if added:
+                active.sort()
+            active = [item for item in active if item[1][B] >= row]
+            painted = 0
+            for rect_id, rect in active:
+                painted = paint_line(line, painted, rect,
+                                     LABELS[rect_id % len(LABELS)], overlap)
+            yield line
+
+    def __str__(self):
+        """ display the original field """
+        return render(self.painted_rows([], None, True))
@@ -0,0 +1,234 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+A persistent store of solutions, keyed by the content of the field.
+
+A field is reduced to a canonical form before it is hashed.  Its strawberries
+are cropped to their bounding box, so translated copies of a field match,
+and the least of the eight rotations and mirror images of the crop is kept,
+so turned and mirrored copies match too.  Greenhouses are stored in the
+coordinates of the canonical form and mapped back through the transform of
+whichever field finds them.
+
+Entries live in SQLite along with a fingerprint of the settings that solved
+them.  A lookup under other settings misses, and invalidate() drops every
+entry made under other settings.  A store keeps at most max_entries
+solutions, evicting the least recently used.  The number of entries is kept
+in a table of its own, changed in the same transaction as the entries, so
+an insert need not count them; once it passes max_entries a batch of the
+oldest is dropped at once.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from hashlib import sha1
+
+from rectangle import GREENHOUSE_COST, make_rectangle
+
+T, L, B, R = 0, 1, 2, 3
+DEFAULT_MAX_ENTRIES = 100000
+EVICT_BATCH = 64  # entries dropped beyond the excess when a store overfills
+# the rotations and mirror images of a grid, as (transpose, flip rows,
+# flip columns); rows and columns are flipped before transposing
+TRANSFORMS = [(transpose, flip_rows, flip_cols)
+              for transpose in (False, True)
+              for flip_rows in (False, True)
+              for flip_cols in (False, True)]
+
+# open stores, one per path and process: a connection must not cross a fork
+_STORES = {}
+
+
+class FieldKey(
+        namedtuple("FieldKey",
+                   "digest, transform, height, width, top, left")):
+    """ where a field's solutions are stored, and how to map them back:
+    the field's berries, less top and left, turn into the canonical form
+    of height x width by transform """
+    __slots__ = ()
+
+    def to_canonical(self, rect):
+        """ return a greenhouse of the field in canonical coordinates """
+        corners = [transform_point((row - self.top, col - self.left),
+                                   self.height, self.width, self.transform)
+                   for row, col in ((rect[T], rect[L]), (rect[B], rect[R]))]
+        return [min(corners[0][0], corners[1][0]),
+                min(corners[0][1], corners[1][1]),
+                max(corners[0][0], corners[1][0]),
+                max(corners[0][1], corners[1][1])]
+
+    def from_canonical(self, box):
+        """ return a greenhouse in canonical coordinates placed on the
+        field """
+        corners = [invert_point(point, self.height, self.width,
+                                self.transform)
+                   for point in ((box[T], box[L]), (box[B], box[R]))]
+        return make_rectangle(min(corners[0][0], corners[1][0]) + self.top,
+                              min(corners[0][1], corners[1][1]) + self.left,
+                              max(corners[0][0], corners[1][0]) + self.top,
+                              max(corners[0][1], corners[1][1]) + self.left)
+
+
+def transform_point(point, height, width, transform):
+    """ map a point of a height x width grid through a transform """
+    row, col = point
+    transpose, flip_rows, flip_cols = transform
+    if flip_rows:
+        row = height - 1 - row
+    if flip_cols:
+        col = width - 1 - col
+    if transpose:
+        row, col = col, row
+    return row, col
+
+
+def invert_point(point, height, width, transform):
+    """ map a transformed point back onto the height x width grid it came
+    from """
+    row, col = point
+    transpose, flip_rows, flip_cols = transform
+    if transpose:
+        row, col = col, row
+    if flip_rows:
+        row = height - 1 - row
+    if flip_cols:
+        col = width - 1 - col
+    return row, col
+
+
+def field_key(field):
+    """ return the FieldKey of a field, or None if it has no strawberries """
+    root = field.root_region
+    if root[T] > root[B]:
+        return None
+    top, left = root[T], root[L]
+    height, width = root[B] - top + 1, root[R] - left + 1
+    berries = [(row - top, col - left)
+               for row, col in field.get_berries_in_rectangle(root)]
+    best = None
+    for transform in TRANSFORMS:
+        points = sorted([transform_point(point, height, width, transform)
+                         for point in berries])
+        shape = (width, height) if transform[0] else (height, width)
+        text = "%d %d %d\n%s" % ((field.maximum_greenhouses,) + shape +
+                                 (" ".join(["%d,%d" % p for p in points]),))
+        if best is None or text < best[0]:
+            best = text, transform
+    return FieldKey(sha1(best[0]).hexdigest(), best[1], height, width,
+                    top, left)
+
+
+class SolutionStore(object):
+    """ solutions kept in an SQLite database """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        """ open, or create, the store at path """
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS solutions ("
+                "digest TEXT, settings TEXT, cost INTEGER, "
+                "greenhouses TEXT, used REAL, "
+                "PRIMARY KEY (digest, settings))")
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS solutions_used "
+                "ON solutions (used)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (entries INTEGER)")
+            # a store made before the count was kept is counted once
+            self.connection.execute(
+                "INSERT INTO meta SELECT (SELECT COUNT(*) FROM solutions) "
+                "WHERE NOT EXISTS (SELECT 1 FROM meta)")
+
+    def get(self, key, settings):
+        """ return the stored greenhouses of the field with this key,
+        solved under these settings, placed on the field; or None """
+        row = self.connection.execute(
+            "SELECT greenhouses FROM solutions "
+            "WHERE digest = ? AND settings = ?",
+            (key.digest, settings)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE solutions SET used = ? "
+                "WHERE digest = ? AND settings = ?",
+                (time.time(), key.digest, settings))
+        return [key.from_canonical(box) for box in json.loads(row[0])]
+
+    def put(self, key, settings, greenhouses):
+        """ store the greenhouses of the field with this key, evicting the
+        least recently used entries if the store is full """
+        boxes = [key.to_canonical(rect) for rect in greenhouses]
+        cost = sum([(box[B] - box[T] + 1) * (box[R] - box[L] + 1) +
+                    GREENHOUSE_COST for box in boxes])
+        row = (key.digest, settings, cost, json.dumps(boxes), time.time())
+        with self.connection:
+            added = self.connection.execute(
+                "INSERT OR IGNORE INTO solutions VALUES (?, ?, ?, ?, ?)",
+                row).rowcount
+            if not added:
+                self.connection.execute(
+                    "UPDATE solutions SET cost = ?, greenhouses = ?, "
+                    "used = ? WHERE digest = ? AND settings = ?",
+                    row[2:] + row[:2])
+            else:
+                self.connection.execute(
+                    "UPDATE meta SET entries = entries + 1")
+                if self.max_entries is not None:
+                    self.evict()
+
+    def evict(self):
+        """ if the store holds more than max_entries, drop the excess and
+        up to EVICT_BATCH more of the least recently used, at most a
+        sixteenth of the store; within put's transaction """
+        excess = self._entries() - self.max_entries
+        if excess > 0:
+            dropped = self.connection.execute(
+                "DELETE FROM solutions WHERE rowid IN ("
+                "SELECT rowid FROM solutions ORDER BY used LIMIT ?)",
+                (excess + min(EVICT_BATCH, self.max_entries // 16),)).rowcount
+            self.connection.execute(
+                "UPDATE meta SET entries = entries - ?", (dropped,))
+
+    def invalidate(self, settings=None):
+        """ drop the entries made under settings other than these, or every
+        entry if settings is None """
+        with self.connection:
+            if settings is None:
+                dropped = self.connection.execute(
+                    "DELETE FROM solutions").rowcount
+            else:
+                dropped = self.connection.execute(
+                    "DELETE FROM solutions WHERE settings != ?",
+                    (settings,)).rowcount
+            self.connection.execute(
+                "UPDATE meta SET entries = entries - ?", (dropped,))
+
+    def __len__(self):
+        """ return the number of stored solutions """
+        return self._entries()
+
+    def _entries(self):
+        """ return the kept count of stored solutions """
+        return self.connection.execute(
+            "SELECT entries FROM meta").fetchone()[0]
+
+    def close(self):
+        """ close the database """
+        self.connection.close()
+
+
+def open_store(path, max_entries=DEFAULT_MAX_ENTRIES):
+    """ return the store at path, opening it once per process """
+    key = (path, os.getpid())
+    store = _STORES.get(key)
+    if store is None:
+        store = _STORES[key] = SolutionStore(path, max_entries)
+    store.max_entries = max_entries
+    return store
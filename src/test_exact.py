@@ -0,0 +1,115 @@
+"""
+
+@author: clifford.lyon@gmail.com
+
+Checks the exact solver against brute force on small fields.  Run from
+src:
+
+    PATH_TO_PYTHON -m unittest test_exact
+"""
+
+import random
+import unittest
+
+from exact import CoverSearch, solve_exact
+from field import StrawberryField
+
+
+def brute_force(field):
+    """ return the cost of the cheapest covering of a field, trying every
+    set of non overlapping rectangles """
+    berries = [(row, col) for row in xrange(field.num_rows)
+               for col in xrange(field.num_cols)
+               if field.has_berry((row, col))]
+    best = [None]
+
+    def cover(placed, cost):
+        if best[0] is not None and cost >= best[0]:
+            return
+        left = [berry for berry in berries
+                if not any([inside(berry, rect) for rect in placed])]
+        if not left:
+            best[0] = cost
+            return
+        if len(placed) == field.maximum_greenhouses:
+            return
+        row, col = left[0]
+        for top in xrange(row + 1):
+            for bottom in xrange(row, field.num_rows):
+                for first in xrange(col + 1):
+                    for last in xrange(col, field.num_cols):
+                        rect = (top, first, bottom, last)
+                        if any([overlaps(rect, other) for other in placed]):
+                            continue
+                        area = (bottom - top + 1) * (last - first + 1)
+                        cover(placed + [rect], cost + 10 + area)
+
+    cover([], 0)
+    return best[0]
+
+
+def inside(berry, rect):
+    """ return true if the rectangle covers the berry """
+    return rect[0] <= berry[0] <= rect[2] and rect[1] <= berry[1] <= rect[3]
+
+
+def overlaps(rect, other):
+    """ return true if two rectangles share a cell """
+    return not (rect[2] < other[0] or other[2] < rect[0] or
+                rect[3] < other[1] or other[3] < rect[1])
+
+
+def random_field(rng, rows, cols, density, maximum_greenhouses):
+    """ return a field with strawberries placed at random, at least one """
+    lines = [["@" if rng.random() < density else "." for _ in xrange(cols)]
+             for _ in xrange(rows)]
+    lines[rng.randrange(rows)][rng.randrange(cols)] = "@"
+    return StrawberryField([str(maximum_greenhouses)] +
+                           ["".join(line) for line in lines])
+
+
+def root_bound(field):
+    """ return branch_and_bound's lower bound before anything is placed """
+    search = CoverSearch(field, None, [], None)
+    return search.lower_bound([0] * field.num_rows, 0,
+                              field.maximum_greenhouses)
+
+
+class ExactTest(unittest.TestCase):
+    """ solve_exact and its lower bound against brute force """
+
+    def test_random_fields(self):
+        """ the proven cost is the brute force optimum, and the root bound
+        does not exceed it """
+        rng = random.Random(7)
+        for _ in xrange(200):
+            field = random_field(rng, rng.randint(2, 5), rng.randint(2, 6),
+                                 rng.choice([0.2, 0.4, 0.6]),
+                                 rng.randint(1, 3))
+            optimum = brute_force(field)
+            solution, proven = solve_exact(field)
+            self.assertTrue(proven)
+            self.assertEqual(sum([rect[4] for rect in solution]), optimum,
+                             str(field))
+            self.assertTrue(root_bound(field) <= optimum, str(field))
+
+    def test_wide_gaps(self):
+        """ more greenhouses than berries in a row do not raise the bound:
+        full columns far apart, and one berry beside them """
+        lines = []
+        for row in xrange(10):
+            line = ["."] * 61
+            for col in (0, 20, 40):
+                line[col] = "@"
+            if row == 0:
+                line[60] = "@"
+            lines.append("".join(line))
+        field = StrawberryField(["4"] + lines)
+        solution, proven = solve_exact(field)
+        self.assertTrue(proven)
+        self.assertEqual(sum([rect[4] for rect in solution]), 71)
+        self.assertTrue(root_bound(field) <= 71)
+
+
+if __name__ == "__main__":
+    unittest.main()